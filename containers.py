@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Consulta compartilhada dos containers do projeto (usada por on.py e off.py)
+"""
+import subprocess
+import os
+import json
+import re
+from pathlib import Path
+
+def get_containers():
+    """Obtém o estado de todos os containers do projeto em uma única chamada
+
+    Retorna um dicionário indexado pelo nome do serviço no docker-compose.
+    """
+    project = os.getenv("COMPOSE_PROJECT_NAME") or re.sub(r"[^a-z0-9_-]", "", Path.cwd().name.lower())
+    result = subprocess.run(
+        ["docker", "ps", "--all",
+         "--filter", f"label=com.docker.compose.project={project}",
+         "--format", "{{json .}}"],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+
+    containers = {}
+    for line in result.stdout.splitlines():
+        if not line.strip():
+            continue
+        container = json.loads(line)
+        labels = dict(
+            label.split("=", 1) for label in container.get("Labels", "").split(",") if "=" in label
+        )
+        service = labels.get("com.docker.compose.service", container.get("Names", ""))
+        containers[service] = container
+    return containers
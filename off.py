@@ -5,6 +5,9 @@ Script para parar o sistema de mensagens distribuído
 import subprocess
 import sys
 import time
+import os
+
+from containers import get_containers
 
 def print_banner():
     """Exibe banner"""
@@ -13,32 +16,27 @@ def print_banner():
     print("=" * 70)
     print()
 
-def show_running_containers():
+def running_services(containers):
+    """Filtra os serviços em execução de um snapshot de containers"""
+    return sorted(
+        service for service, container in containers.items()
+        if container.get("State") == "running"
+    )
+
+def show_running_containers(containers):
     """Mostra containers em execução"""
     print("→ Containers em execução:")
     print("-" * 70)
-    try:
-        result = subprocess.run(
-            ["docker-compose", "ps", "--services", "--filter", "status=running"],
-            capture_output=True,
-            text=True,
-            check=False
-        )
-
-        services = result.stdout.strip().split('\n')
-        services = [s for s in services if s]  # Remove linhas vazias
 
-        if services:
-            for service in services:
-                print(f"  • {service}")
-            print(f"\nTotal: {len(services)} serviço(s)")
-            return True
-        else:
-            print("  Nenhum container em execução")
-            return False
+    services = running_services(containers)
 
-    except Exception as e:
-        print(f"⚠ Erro ao listar containers: {e}")
+    if services:
+        for service in services:
+            print(f"  • {service}")
+        print(f"\nTotal: {len(services)} serviço(s)")
+        return True
+    else:
+        print("  Nenhum container em execução")
         return False
 
 def ask_confirmation():
@@ -83,31 +81,33 @@ def stop_containers():
         print(f"\n✗ ERRO: {e}")
         return False
 
+def walk_files(path):
+    """Percorre recursivamente os arquivos de um diretório usando os.scandir"""
+    for entry in os.scandir(path):
+        if entry.is_dir(follow_symlinks=False):
+            yield from walk_files(entry.path)
+        else:
+            yield entry
+
 def show_data_preservation():
     """Mostra informações sobre dados preservados"""
     print("\n→ Dados preservados em disco:")
     print("-" * 70)
 
-    import os
-    from pathlib import Path
-
-    data_dir = Path("data")
+    data_dir = "data"
 
-    if data_dir.exists():
+    if os.path.isdir(data_dir):
         total_size = 0
         file_count = 0
 
-        for root, dirs, files in os.walk(data_dir):
-            for file in files:
-                file_path = Path(root) / file
-                try:
-                    size = file_path.stat().st_size
-                    total_size += size
-                    file_count += 1
-                    rel_path = file_path.relative_to(data_dir)
-                    print(f"  {rel_path} ({size} bytes)")
-                except Exception:
-                    pass
+        for entry in walk_files(data_dir):
+            try:
+                size = entry.stat(follow_symlinks=False).st_size
+                total_size += size
+                file_count += 1
+                print(f"  {os.path.relpath(entry.path, data_dir)} ({size} bytes)")
+            except OSError:
+                pass
 
         print(f"\nTotal: {file_count} arquivo(s), {total_size} bytes")
         print("\n⚠ Para limpar dados, execute:")
@@ -137,16 +137,12 @@ def verify_stopped():
     print("\n→ Verificando status final...")
 
     try:
-        result = subprocess.run(
-            ["docker-compose", "ps", "-q"],
-            capture_output=True,
-            text=True,
-            check=False
-        )
+        services = running_services(get_containers())
 
-        if result.stdout.strip():
+        if services:
             print("⚠ Alguns containers ainda estão em execução")
-            subprocess.run(["docker-compose", "ps"], check=False)
+            for service in services:
+                print(f"  • {service}")
             return False
         else:
             print("✓ Todos os containers foram parados")
@@ -160,8 +156,15 @@ def main():
     """Função principal"""
     print_banner()
 
+    # Snapshot único do estado dos containers
+    try:
+        containers = get_containers()
+    except Exception as e:
+        print(f"⚠ Erro ao listar containers: {e}")
+        containers = {}
+
     # Mostra containers em execução
-    has_running = show_running_containers()
+    has_running = show_running_containers(containers)
 
     if not has_running:
         print("\n✓ Sistema já está desligado")
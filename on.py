@@ -5,7 +5,14 @@ Script para iniciar o sistema de mensagens distribuído
 import subprocess
 import sys
 import time
-import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from containers import get_containers
+
+SERVERS = ["servidor_1", "servidor_2", "servidor_3"]
+
+# Com --verbose as versões do Docker/Compose são consultadas e exibidas
+VERBOSE = "--verbose" in sys.argv
 
 def print_banner():
     """Exibe banner do sistema"""
@@ -15,41 +22,42 @@ def print_banner():
     print()
 
 def check_docker():
-    """Verifica se Docker está instalado e rodando"""
-    try:
-        result = subprocess.run(
-            ["docker", "--version"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print(f"✓ Docker encontrado: {result.stdout.strip()}")
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("✗ ERRO: Docker não encontrado ou não está rodando")
+    """Verifica se Docker está instalado"""
+    if shutil.which("docker") is None:
+        print("✗ ERRO: Docker não encontrado")
         print("  Instale o Docker: https://docs.docker.com/get-docker/")
         return False
 
+    if VERBOSE:
+        result = subprocess.run(["docker", "--version"], capture_output=True, text=True, check=False)
+        print(f"✓ Docker encontrado: {result.stdout.strip()}")
+    else:
+        print("✓ Docker encontrado")
+    return True
+
 def check_docker_compose():
     """Verifica se Docker Compose está instalado"""
-    try:
-        result = subprocess.run(
-            ["docker-compose", "--version"],
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print(f"✓ Docker Compose encontrado: {result.stdout.strip()}")
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
+    if shutil.which("docker-compose") is None:
         print("✗ ERRO: Docker Compose não encontrado")
         print("  Instale o Docker Compose: https://docs.docker.com/compose/install/")
         return False
 
+    if VERBOSE:
+        result = subprocess.run(["docker-compose", "--version"], capture_output=True, text=True, check=False)
+        print(f"✓ Docker Compose encontrado: {result.stdout.strip()}")
+    else:
+        print("✓ Docker Compose encontrado")
+    return True
+
 def stop_existing_containers():
     """Para containers existentes"""
     print("\n→ Parando containers existentes (se houver)...")
     try:
+        # 'docker-compose down' leva alguns segundos mesmo sem nada rodando
+        if not get_containers():
+            print("✓ Nenhum container anterior encontrado")
+            return
+
         subprocess.run(
             ["docker-compose", "down"],
             capture_output=True,
@@ -64,18 +72,9 @@ def build_images():
     print("\n→ Construindo imagens Docker...")
     print("  (Isso pode levar alguns minutos na primeira vez)\n")
     try:
-        process = subprocess.Popen(
-            ["docker-compose", "build"],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            bufsize=1
-        )
-
-        for line in process.stdout:
-            print(f"  {line}", end='')
-
-        process.wait()
+        # Saída do build vai direto para o terminal (sem passar pelo Python)
+        sys.stdout.flush()
+        process = subprocess.run(["docker-compose", "build"], check=False)
 
         if process.returncode == 0:
             print("\n✓ Imagens construídas com sucesso")
@@ -113,43 +112,88 @@ def start_services():
         print(f"✗ ERRO ao iniciar serviços: {e}")
         return False
 
-def wait_for_services():
-    """Aguarda serviços ficarem prontos"""
+def wait_for_services(timeout=30, interval=0.5):
+    """Aguarda serviços ficarem prontos
+
+    Consulta o healthcheck dos servidores até todos ficarem saudáveis,
+    em vez de esperar um tempo fixo.
+    """
     print("\n→ Aguardando serviços ficarem prontos...")
     print("  (Eleição de coordenador, sincronização, etc.)")
 
-    for i in range(15, 0, -1):
-        print(f"  {i}s...", end='\r')
-        time.sleep(1)
-
-    print("✓ Serviços prontos" + " " * 20)
+    start = time.monotonic()
+    health = {}
+    while time.monotonic() - start < timeout:
+        result = subprocess.run(
+            ["docker", "inspect", "--format",
+             "{{.Name}} {{if .State.Health}}{{.State.Health.Status}}{{end}}", *SERVERS],
+            capture_output=True,
+            text=True,
+            check=False
+        )
+        health = dict(
+            (line.split() + [""])[:2] for line in result.stdout.splitlines() if line.strip()
+        )
+        if len(health) == len(SERVERS) and all(status == "healthy" for status in health.values()):
+            print(f"✓ Serviços prontos ({time.monotonic() - start:.1f}s)" + " " * 20)
+            return True
 
-def show_logs():
+        print(f"  {time.monotonic() - start:.0f}s...", end='\r')
+        time.sleep(interval)
+
+    pending = [name.lstrip("/") for name, status in health.items() if status != "healthy"]
+    print(f"⚠ Tempo esgotado aguardando serviços: {', '.join(pending) or ', '.join(SERVERS)}")
+    return False
+
+def fetch_logs():
+    """Obtém as últimas linhas de log de cada servidor
+
+    Uma única chamada ao docker-compose (linhas prefixadas com "servico | ")
+    demultiplexada por serviço.
+    """
+    result = subprocess.run(
+        ["docker-compose", "logs", "--no-color", "--tail=5", *SERVERS],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+
+    logs = {service: [] for service in SERVERS}
+    for line in result.stdout.splitlines():
+        prefix, sep, message = line.partition("|")
+        service = prefix.strip()
+        if sep and service in logs:
+            logs[service].append(message[1:] if message.startswith(" ") else message)
+    return logs
+
+def show_logs(logs_future):
     """Mostra logs dos serviços"""
     print("\n→ Logs dos serviços:")
     print("-" * 70)
 
-    services = ["servidor_1", "servidor_2", "servidor_3"]
+    try:
+        logs = logs_future.result()
+    except Exception as e:
+        print(f"⚠ Não foi possível obter logs dos servidores: {e}")
+        return
 
-    for service in services:
-        try:
-            result = subprocess.run(
-                ["docker", "logs", "--tail", "5", service],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-            print(f"\n[{service}]")
-            print(result.stdout[-500:] if len(result.stdout) > 500 else result.stdout)
-        except Exception as e:
-            print(f"⚠ Não foi possível obter logs de {service}: {e}")
+    for service in SERVERS:
+        output = "\n".join(logs[service])
+        print(f"\n[{service}]")
+        print(output[-500:] if len(output) > 500 else output)
 
-def show_status():
+def show_status(containers_future):
     """Mostra status dos containers"""
     print("\n→ Status dos containers:")
     print("-" * 70)
     try:
-        subprocess.run(["docker-compose", "ps"], check=True)
+        containers = containers_future.result()
+        if not containers:
+            print("  Nenhum container encontrado")
+            return
+        for service, container in sorted(containers.items()):
+            icon = "✓" if container.get("State") == "running" else "✗"
+            print(f"  {icon} {service:<12} {container.get('State', 'N/A'):<10} ({container.get('Status', 'N/A')})")
     except Exception as e:
         print(f"⚠ Erro ao obter status: {e}")
 
@@ -252,11 +296,16 @@ def main():
     # Aguardar serviços
     wait_for_services()
 
-    # Mostrar status
-    show_status()
+    # Status e logs são consultas independentes ao daemon - buscar em paralelo
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        containers_future = executor.submit(get_containers)
+        logs_future = executor.submit(fetch_logs)
+
+        # Mostrar status
+        show_status(containers_future)
 
-    # Mostrar logs
-    show_logs()
+        # Mostrar logs
+        show_logs(logs_future)
 
     # Opções interativas
     start_client_interactive()
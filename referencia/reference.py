@@ -1,40 +1,77 @@
 #!/usr/bin/env python3
 import zmq
 import msgpack
+import heapq
+import os
 import time
-from datetime import datetime
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition
+
+# Tempo sem heartbeat para considerar um servidor inativo (segundos)
+SERVER_TIMEOUT = 30
 
 class ReferenceServer:
     def __init__(self):
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REP)
+        # ROUTER na frente e DEALER inproc para distribuir requisições entre workers
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.workers_socket = self.context.socket(zmq.DEALER)
+        self.num_workers = int(os.getenv("REFERENCE_WORKERS", "4"))
         self.pub_socket = self.context.socket(zmq.PUB)
         
+        # Um único lock protege relógio lógico e registro de servidores
+        self.state_lock = Lock()
+        # Acorda a limpeza quando surge uma expiração mais próxima que a aguardada
+        self.expiry_changed = Condition(self.state_lock)
+
         # Relógio lógico
         self.logical_clock = 0
-        self.clock_lock = Lock()
         
         # Registro de servidores
-        self.servers = {}  # {name: {"rank": int, "last_heartbeat": timestamp}}
-        self.servers_lock = Lock()
+        self.servers = {}  # {name: {"rank": int, "last_heartbeat": time.monotonic()}}
+        self.expiry_heap = []  # [(expira_em, name)] - entradas antigas são descartadas ao sair do heap
         self.next_rank = 1
         
+        # Lista de servidores da resposta 'list', reconstruída só quando o registro muda
+        self.servers_generation = 0
+        self.cached_list_generation = -1
+        self.cached_server_list = []
+        
         print("Servidor de Referência iniciado")
     
     def increment_clock(self):
         """Incrementa o relógio lógico"""
-        with self.clock_lock:
+        with self.state_lock:
             self.logical_clock += 1
             return self.logical_clock
     
     def update_clock(self, received_clock):
         """Atualiza relógio lógico baseado no recebido"""
-        with self.clock_lock:
+        with self.state_lock:
             self.logical_clock = max(self.logical_clock, received_clock) + 1
             return self.logical_clock
     
-    def handle_rank(self, data):
+    def touch_server(self, name, now):
+        """Atualiza heartbeat e agenda a expiração do servidor (requer state_lock)"""
+        self.servers[name]["last_heartbeat"] = now
+        heapq.heappush(self.expiry_heap, (now + SERVER_TIMEOUT, name))
+        if self.expiry_heap[0][1] == name:
+            self.expiry_changed.notify()
+
+    def expire_servers(self, now):
+        """Remove servidores sem heartbeat há SERVER_TIMEOUT (requer state_lock)
+
+        Só visita as entradas do heap que já venceram; uma entrada cujo servidor
+        recebeu heartbeat depois dela é apenas descartada.
+        """
+        while self.expiry_heap and self.expiry_heap[0][0] <= now:
+            _, name = heapq.heappop(self.expiry_heap)
+            info = self.servers.get(name)
+            if info and now - info["last_heartbeat"] >= SERVER_TIMEOUT:
+                print(f"Servidor '{name}' removido por inatividade")
+                del self.servers[name]
+                self.servers_generation += 1
+
+    def handle_rank(self, data, timestamp):
         """Atribui rank a um servidor"""
         user = data.get("user")
         received_clock = data.get("clock", 0)
@@ -42,51 +79,46 @@ class ReferenceServer:
         # Atualizar relógio lógico
         current_clock = self.update_clock(received_clock)
         
-        with self.servers_lock:
+        with self.state_lock:
             if user not in self.servers:
                 # Novo servidor - atribuir rank
                 rank = self.next_rank
                 self.next_rank += 1
-                self.servers[user] = {
-                    "rank": rank,
-                    "last_heartbeat": time.time()
-                }
+                self.servers[user] = {"rank": rank}
+                self.servers_generation += 1
+                self.touch_server(user, time.monotonic())
                 print(f"Servidor '{user}' registrado com rank {rank}")
             else:
                 # Servidor já existe - retornar rank existente
                 rank = self.servers[user]["rank"]
-                self.servers[user]["last_heartbeat"] = time.time()
+                self.touch_server(user, time.monotonic())
         
         return {
             "service": "rank",
             "data": {
                 "rank": rank,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": timestamp,
                 "clock": current_clock
             }
         }
     
-    def handle_list(self, data):
+    def handle_list(self, data, timestamp):
         """Retorna lista de servidores"""
         received_clock = data.get("clock", 0)
         current_clock = self.update_clock(received_clock)
         
-        with self.servers_lock:
+        with self.state_lock:
             # Limpar servidores inativos (sem heartbeat há mais de 30s)
-            current_time = time.time()
-            active_servers = {
-                name: info for name, info in self.servers.items()
-                if current_time - info["last_heartbeat"] < 30
-            }
-            
-            # Atualizar lista
-            self.servers = active_servers
+            self.expire_servers(time.monotonic())
             
-            # Criar lista de servidores
-            server_list = [
-                {"name": name, "rank": info["rank"]}
-                for name, info in self.servers.items()
-            ]
+            # Criar lista de servidores (reaproveitada enquanto o registro não muda)
+            if self.cached_list_generation != self.servers_generation:
+                self.cached_server_list = [
+                    {"name": name, "rank": info["rank"]}
+                    for name, info in self.servers.items()
+                ]
+                self.cached_list_generation = self.servers_generation
+            server_list = self.cached_server_list
         
         print(f"Lista de servidores: {len(server_list)} ativos")
         
@@ -94,29 +126,31 @@ class ReferenceServer:
             "service": "list",
             "data": {
                 "list": server_list,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": timestamp,
                 "clock": current_clock
             }
         }
     
-    def handle_heartbeat(self, data):
+    def handle_heartbeat(self, data, timestamp):
         """Processa heartbeat de servidor"""
         user = data.get("user")
         received_clock = data.get("clock", 0)
         
-        current_clock = self.update_clock(received_clock)
+        # Caminho mais frequente: relógio e registro em uma única seção crítica
+        with self.state_lock:
+            self.logical_clock = max(self.logical_clock, received_clock) + 1
+            current_clock = self.logical_clock
+            registered = user in self.servers
+            if registered:
+                self.touch_server(user, time.monotonic())
         
-        with self.servers_lock:
-            if user in self.servers:
-                self.servers[user]["last_heartbeat"] = time.time()
-                # print(f"Heartbeat recebido de '{user}'")
-            else:
-                print(f"Heartbeat de servidor não registrado: '{user}'")
+        if not registered:
+            print(f"Heartbeat de servidor não registrado: '{user}'")
         
+        # Os servidores só usam o relógio da resposta
         return {
             "service": "heartbeat",
             "data": {
-                "timestamp": datetime.now().isoformat(),
                 "clock": current_clock
             }
         }
@@ -124,7 +158,9 @@ class ReferenceServer:
     def process_request(self, message):
         """Processa requisição recebida"""
         try:
-            request = msgpack.unpackb(message, raw=False)
+            request = msgpack.unpackb(message, raw=False, use_list=False)
+            # Um único timestamp por requisição, compartilhado pelos handlers
+            timestamp = time.time_ns()
             service = request.get("service")
             data = request.get("data", {})
             
@@ -138,14 +174,14 @@ class ReferenceServer:
             
             handler = handlers.get(service)
             if handler:
-                return handler(data)
+                return handler(data, timestamp)
             else:
                 current_clock = self.increment_clock()
                 return {
                     "service": service,
                     "data": {
                         "status": "erro",
-                        "timestamp": datetime.now().isoformat(),
+                        "timestamp": timestamp,
                         "description": f"Serviço '{service}' não reconhecido",
                         "clock": current_clock
                     }
@@ -158,34 +194,59 @@ class ReferenceServer:
                 "service": "error",
                 "data": {
                     "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "description": str(e),
                     "clock": current_clock
                 }
             }
     
     def cleanup_servers(self):
-        """Thread para limpar servidores inativos periodicamente"""
-        while True:
-            time.sleep(10)  # Verificar a cada 10 segundos
-            
-            with self.servers_lock:
-                current_time = time.time()
-                inactive = []
-                
-                for name, info in self.servers.items():
-                    if current_time - info["last_heartbeat"] > 30:
-                        inactive.append(name)
+        """Thread para limpar servidores inativos
+
+        Dorme até a próxima expiração agendada no heap (ou indefinidamente, se
+        não há servidores) em vez de acordar em intervalos fixos.
+        """
+        with self.expiry_changed:
+            while True:
+                now = time.monotonic()
+                self.expire_servers(now)
                 
-                for name in inactive:
-                    print(f"Servidor '{name}' removido por inatividade")
-                    del self.servers[name]
+                timeout = self.expiry_heap[0][0] - now if self.expiry_heap else None
+                self.expiry_changed.wait(timeout)
     
+    def worker(self):
+        """Thread worker: processa requisições repassadas pelo DEALER inproc"""
+        worker_socket = self.context.socket(zmq.REP)
+        worker_socket.connect("inproc://workers")
+
+        # Packer reutilizado entre respostas (um por worker: Packer não é thread-safe)
+        packer = msgpack.Packer(use_bin_type=True)
+
+        try:
+            while True:
+                # Receber requisição
+                message = worker_socket.recv()
+
+                # Processar
+                response = self.process_request(message)
+
+                # Enviar resposta sem copiar o buffer para dentro da mensagem zmq
+                worker_socket.send(packer.pack(response), copy=False, track=False)
+        except zmq.ContextTerminated:
+            pass
+        finally:
+            worker_socket.close()
+
     def start(self):
         """Inicia o servidor de referência"""
         
         self.socket.bind("tcp://*:5559")
-        print("Socket REP escutando na porta 5559")
+        print("Socket ROUTER escutando na porta 5559")
+
+        self.workers_socket.bind("inproc://workers")
+        for _ in range(self.num_workers):
+            Thread(target=self.worker, daemon=True).start()
+        print(f"{self.num_workers} workers processando requisições")
         
         
         self.pub_socket.bind("tcp://*:5560")
@@ -198,20 +259,14 @@ class ReferenceServer:
         print("Servidor de Referência pronto!\n")
         
         try:
-            while True:
-                # Receber requisição
-                message = self.socket.recv()
-                
-                # Processar
-                response = self.process_request(message)
-                
-                # Enviar resposta
-                self.socket.send(msgpack.packb(response))
+            # Repassa requisições do ROUTER para os workers e as respostas de volta
+            zmq.proxy(self.socket, self.workers_socket)
         
         except KeyboardInterrupt:
             print("\nServidor de Referência encerrado")
         finally:
             self.socket.close()
+            self.workers_socket.close()
             self.pub_socket.close()
             self.context.term()
 
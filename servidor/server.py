@@ -1,28 +1,282 @@
 #!/usr/bin/env python3
 import zmq
-import json  # Mantido apenas para persistência em disco
+import orjson  # Usado apenas para persistência em disco
 import msgpack
+import zstandard
+import mmap
 import os
+import sys
 import time
+import queue
+import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from operator import itemgetter
 from pathlib import Path
-from threading import Thread, Lock
+from threading import Thread, Lock, Event, local
+
+# Linhas de log pendentes: a escrita no stdout ocorre numa thread própria,
+# fora do caminho das requisições
+LOG_QUEUE = queue.SimpleQueue()
+
+def log(message):
+    """Enfileira uma linha de log (substitui print no servidor)"""
+    LOG_QUEUE.put(message)
+
+# Linhas de diagnóstico dos laços quentes (por mensagem/requisição) só com LOG_LEVEL=DEBUG
+LOG_DEBUG = os.getenv("LOG_LEVEL", "INFO").upper() == "DEBUG"
+
+def debug(message, *args):
+    """Enfileira uma linha de diagnóstico; a formatação (%) só ocorre com DEBUG ativo"""
+    if LOG_DEBUG:
+        LOG_QUEUE.put(message % args if args else message)
+
+def debug_exception():
+    """Enfileira o traceback da exceção corrente (apenas com LOG_LEVEL=DEBUG)"""
+    if LOG_DEBUG:
+        LOG_QUEUE.put(traceback.format_exc().rstrip())
+
+def flush_log(lines=None):
+    """Escreve no stdout, numa única escrita, todas as linhas pendentes"""
+    lines = lines or []
+    while True:
+        try:
+            lines.append(LOG_QUEUE.get_nowait())
+        except queue.Empty:
+            break
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
+        sys.stdout.flush()
+
+def log_loop():
+    """Thread de log: aguarda a primeira linha e escreve o lote acumulado"""
+    while True:
+        flush_log([LOG_QUEUE.get()])
+
+# Arquivo de prontidão usado pelo healthcheck do docker-compose
+READY_FILE = Path("/tmp/ready")
+
+# Tópico de coordenação entre servidores, já codificado
+SERVERS_TOPIC = b"servers"
+
+# Coleções persistidas: nome -> (serviço, chave dos dados) do snapshot JSON
+COLLECTIONS = {
+    "users": ("users", "users"),
+    "channels": ("channels", "users"),  # Note: usa 'users' conforme especificação
+    "logins": ("login", "logins"),
+    "messages": ("message", "messages"),
+    "publications": ("publish", "publications"),
+}
+
+# fdatasync só existe em alguns sistemas (ex.: Linux); fsync nos demais
+fdatasync = getattr(os, "fdatasync", os.fsync)
+
+# Mensagens/publicações recentes mantidas em memória; o histórico completo fica em disco
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "1024"))
+
+# Chave de deduplicação das coleções de histórico
+HISTORY_KEYS = {
+    "messages": itemgetter("src", "dst", "message", "timestamp"),
+    "publications": itemgetter("channel", "user", "message", "timestamp"),
+}
+
+# Logs append-only: frames MessagePack prefixados pelo tamanho (4 bytes, big-endian)
+LOG_SUFFIX = ".mpl"
+
+# Um Packer por thread para os helpers de serialização (Packer não é thread-safe;
+# msgpack.packb criaria um novo a cada chamada)
+THREAD_PACKERS = local()
+
+def thread_packer():
+    """Retorna o Packer da thread atual, criando-o na primeira chamada"""
+    packer = getattr(THREAD_PACKERS, "packer", None)
+    if packer is None:
+        packer = THREAD_PACKERS.packer = msgpack.Packer()
+    return packer
+
+def frame_record(record):
+    """Serializa um registro como frame do log: tamanho (4 bytes) + MessagePack"""
+    body = thread_packer().pack(record)
+    return len(body).to_bytes(4, "big") + body
+
+def read_frames(path):
+    """Lê os frames completos do log; retorna (registros, bytes válidos)"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return [], 0  # mmap não aceita arquivo vazio
+        # Log mapeado em memória: os frames são decodificados direto das páginas, sem cópia
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as buf:
+                return parse_frames(buf)
+
+def parse_frames(buf):
+    """Decodifica os frames completos de buf; retorna (registros, bytes válidos)"""
+    records = []
+    offset = 0
+    while offset + 4 <= len(buf):
+        size = int.from_bytes(buf[offset:offset + 4], "big")
+        offset += 4
+        if offset + size > len(buf):
+            offset -= 4
+            break
+        with buf[offset:offset + size] as frame:
+            records.append(msgpack.unpackb(frame, raw=False))
+        offset += size
+    return records, offset
+
+# Timestamp ISO das respostas: reformatado no máximo a cada ISO_TIMESTAMP_TTL segundos
+ISO_TIMESTAMP_TTL = int(os.getenv("ISO_TIMESTAMP_TTL_MS", "50")) / 1000
+ISO_TIMESTAMP = (float("-inf"), "")  # (instante monotonic, texto); trocado por atribuição atômica
+
+def iso_now():
+    """Timestamp ISO do momento atual, reaproveitado entre requisições dentro da validade"""
+    global ISO_TIMESTAMP
+    checked, text = ISO_TIMESTAMP
+    now = time.monotonic()
+    if now - checked >= ISO_TIMESTAMP_TTL:
+        text = datetime.now().isoformat()
+        ISO_TIMESTAMP = (now, text)
+    return text
+
+# Validade da lista de servidores obtida da referência
+SERVERS_LIST_TTL = 1.0
+
+# Espera máxima de uma replicação síncrona (requisição com "sync": true)
+REPLICATION_SYNC_TIMEOUT = 2.0
+
+# Intervalo entre heartbeats enviados ao servidor de referência
+HEARTBEAT_INTERVAL = 5
+
+# Sincronização de relógios: a cada CLOCK_SYNC_MESSAGES mensagens, no máximo uma rodada por intervalo
+CLOCK_SYNC_MESSAGES = 10
+CLOCK_SYNC_INTERVAL = int(os.getenv("CLOCK_SYNC_INTERVAL_MS", "1000")) / 1000
+
+# Janela em que operações de replicação são agrupadas numa única publicação
+REPLICATION_BATCH_INTERVAL = int(os.getenv("REPLICATION_BATCH_MS", "30")) / 1000
+# Intervalo mínimo entre as linhas de resumo (INFO) das replicações recebidas
+REPLICATION_LOG_INTERVAL = 5
+# Máximo de operações por lote: limita o tamanho de cada publicação
+REPLICATION_BATCH_MAX = int(os.getenv("REPLICATION_BATCH_MAX", "256"))
+
+# Sincronização completa: resposta comprimida com zstd quando o solicitante pede
+SYNC_COMPRESSION_LEVEL = int(os.getenv("SYNC_COMPRESSION_LEVEL", "3"))
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"  # Início de todo frame zstd (um map msgpack nunca começa assim)
+
+# Tamanho do log append-only a partir do qual ele é compactado no snapshot
+LOG_COMPACT_BYTES = 10 * 1024 * 1024
+
+# Intervalo máximo entre fsyncs dos logs (política "everysec")
+PERSIST_FSYNC_INTERVAL = int(os.getenv("PERSIST_FSYNC_INTERVAL_MS", "1000")) / 1000
+# Espera máxima por um flush/compactação da thread de persistência
+PERSIST_WAIT_TIMEOUT = int(os.getenv("PERSIST_WAIT_TIMEOUT_MS", "30000")) / 1000
+
+# Respostas de erro fixas, pré-serializadas até a chave "timestamp".
+# Apenas timestamp e clock variam; o restante do mapa MessagePack é montado uma vez.
+ERROR_RESPONSES = {
+    "no_user": ("login", "description", "Nome de usuário não fornecido"),
+    "user_exists": ("login", "description", "Usuário já cadastrado"),
+    "no_channel": ("channel", "description", "Nome do canal não fornecido"),
+    "channel_exists": ("channel", "description", "Canal já existe"),
+    "publish_missing": ("publish", "message", "Canal ou mensagem não fornecidos"),
+    "unknown_channel": ("publish", "message", "Canal não existe"),
+    "message_missing": ("message", "message", "Destinatário ou mensagem não fornecidos"),
+    "unknown_user": ("message", "message", "Usuário não existe"),
+    # Requisições com "sync": true cuja gravação (fsync) ou publicação da replicação não foi confirmada
+    "login_not_synced": ("login", "description", "Falha ao confirmar a gravação ou a replicação"),
+    "channel_not_synced": ("channel", "description", "Falha ao confirmar a gravação ou a replicação"),
+    "publish_not_synced": ("publish", "message", "Falha ao confirmar a gravação ou a replicação"),
+    "message_not_synced": ("message", "message", "Falha ao confirmar a gravação ou a replicação"),
+}
+ERROR_PREFIXES = {
+    key: b"\x82" + msgpack.packb("service") + msgpack.packb(service) + msgpack.packb("data")
+         + b"\x84" + msgpack.packb("status") + msgpack.packb("erro")
+         + msgpack.packb(field) + msgpack.packb(text) + msgpack.packb("timestamp")
+    for key, (service, field, text) in ERROR_RESPONSES.items()
+}
+CLOCK_KEY = msgpack.packb("clock")
+
+def error_response(key, timestamp, clock):
+    """Resposta de erro fixa já em MessagePack (apenas timestamp e clock são serializados)"""
+    pack = thread_packer().pack
+    return ERROR_PREFIXES[key] + pack(timestamp) + CLOCK_KEY + pack(clock)
+
+# Respostas de listagem ({"timestamp", "users", "clock"}), pré-serializadas até "timestamp"
+LIST_PREFIXES = {
+    service: b"\x82" + msgpack.packb("service") + msgpack.packb(service) + msgpack.packb("data")
+             + b"\x83" + msgpack.packb("timestamp")
+    for service in ("users", "channels")
+}
+LIST_KEY = msgpack.packb("users")  # Note: canais também usam 'users' conforme especificação
+
+def list_response(service, timestamp, packed_items, clock):
+    """Resposta de listagem já em MessagePack, reaproveitando a lista serializada"""
+    pack = thread_packer().pack
+    return (LIST_PREFIXES[service] + pack(timestamp) + LIST_KEY + packed_items
+            + CLOCK_KEY + pack(clock))
+
+class Completion:
+    """Conclusão de um pedido feito a outra thread: Event + resultado (ok só se deu certo)"""
+    __slots__ = ("event", "ok")
+
+    def __init__(self):
+        self.event = Event()
+        self.ok = False
+
+    def finish(self, ok):
+        self.ok = ok
+        self.event.set()
+
+    def wait(self, timeout):
+        """True somente se o pedido foi concluído dentro do timeout e com sucesso"""
+        return self.event.wait(timeout) and self.ok
+
+def pack_response(response, packer):
+    """Serializa a resposta com o Packer da thread, a menos que ela já esteja pré-serializada"""
+    if isinstance(response, bytes):
+        return response
+    return packer.pack(response)
 
 class MessageServer:
     def __init__(self, data_dir="/data"):
+        Thread(target=log_loop, daemon=True).start()
+
         self.context = zmq.Context()
-        self.socket = self.context.socket(zmq.REP)
+        # ROUTER recebe do broker e repassa, via DEALER inproc, para um pool de workers REP
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
+        self.workers_socket = self.context.socket(zmq.DEALER)
+        self.num_workers = int(os.getenv("SERVER_WORKERS", "4"))
 
         # Socket PUB para publicações
         self.pub_socket = self.context.socket(zmq.PUB)
+        self.pub_socket.setsockopt(zmq.SNDHWM, int(os.getenv("PUB_SNDHWM", "100000")))
+        self.pub_socket.setsockopt(zmq.LINGER, 0)
+        self.pub_socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
+        self.pub_lock = Lock()  # Sockets zmq não são thread-safe
+        self.pub_packer = msgpack.Packer()  # Reutilizado sob pub_lock (Packer não é thread-safe)
 
         # Socket SUB para receber notificações de eleição
         self.sub_socket = self.context.socket(zmq.SUB)
-
-        # Socket REQ para comunicação com referência e outros servidores
-        self.req_socket = self.context.socket(zmq.REQ)
-
-        # Relógio lógico
+        self.sub_socket.setsockopt(zmq.TCP_KEEPALIVE, 1)  # Detecta conexão meio-aberta com o proxy
+
+        # DEALER para heartbeats à referência, atendido pelo laço de eventos junto com o SUB
+        self.heartbeat_socket = self.context.socket(zmq.DEALER)
+        self.heartbeat_socket.setsockopt(zmq.SNDHWM, 1)  # Referência fora do ar: não acumular heartbeats
+        self.heartbeat_socket.setsockopt(zmq.LINGER, 0)
+        self.heartbeat_socket.setsockopt(zmq.IMMEDIATE, 1)  # Sem conexão: falha na hora em vez de enfileirar
+        self.heartbeat_socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
+
+        # Sockets REQ reaproveitados entre chamadas: endereço -> sockets ociosos
+        self.reference_address = os.getenv("REFERENCE_ADDRESS", "tcp://referencia:5559")
+        self.peer_sockets = {}
+        self.peer_sockets_lock = Lock()
+        self.peer_addresses = {}  # Nome do servidor -> endereço servidor-servidor
+        # Eleição e Berkeley consultam os pares em paralelo (latência de um timeout, não N)
+        self.peer_pool = ThreadPoolExecutor(max_workers=int(os.getenv("PEER_POOL_WORKERS", "16")))
+
+        # Relógio lógico: um único contador, lido e avançado sempre sob clock_lock
+        # (nunca substituído, para os valores locais serem estritamente crescentes)
         self.logical_clock = 0
         self.clock_lock = Lock()
 
@@ -36,28 +290,73 @@ class MessageServer:
         self.coordinator = None
         self.coordinator_lock = Lock()
         self.servers_list = []  # Lista de outros servidores
+        self.servers_list_time = None  # Instante (monotonic) da última consulta à referência
         self.servers_lock = Lock()
-        self.message_count = 0  # Contador para sincronização a cada 10 mensagens
+        # Mensagens processadas desde a última rodada de sincronização de relógios:
+        # workers incrementam, clock_sync_loop lê e zera (ambos sob message_count_lock)
+        self.message_count = 0
+        self.message_count_lock = Lock()
+        self.replication_queue = queue.SimpleQueue()  # Operações aguardando o próximo lote
+        # Operações recebidas desde o último resumo (só o laço de eventos as atualiza)
+        self.replicated_ops = 0
+        self.replication_log_time = time.monotonic()
         self.in_election = False  # Flag para evitar eleições simultâneas
+
+        # Pronto somente após conhecer um coordenador (marcador de execução anterior é descartado)
+        READY_FILE.unlink(missing_ok=True)
         
         self.data_dir = Path(data_dir)
         self.data_dir.mkdir(parents=True, exist_ok=True)
         
-        # Arquivos de persistência
-        self.users_file = self.data_dir / "users.json"
-        self.channels_file = self.data_dir / "channels.json"
-        self.logins_file = self.data_dir / "logins.json"
-        self.messages_file = self.data_dir / "messages.json"
-        self.publications_file = self.data_dir / "publications.json"
+        # Arquivos de persistência: snapshot JSON + log append-only (frames MessagePack) por coleção
+        self.snapshot_files = {name: self.data_dir / f"{name}.json" for name in COLLECTIONS}
+        self.log_files = {name: self.data_dir / f"{name}{LOG_SUFFIX}" for name in COLLECTIONS}
         
-        # Carregar dados existentes
-        self.users = self.load_data(self.users_file, [], 'users')
-        self.channels = self.load_data(self.channels_file, [], 'users')  # Note: usa 'users' conforme especificação
-        self.logins = self.load_data(self.logins_file, [], 'logins')
-        self.messages = self.load_data(self.messages_file, [], 'messages')
-        self.publications = self.load_data(self.publications_file, [], 'publications')
+        # Carregar dados existentes (snapshot + registros do log)
+        self.channels = self.load_collection("channels")
+        self.logins = self.load_collection("logins")
+        # Usuários derivam dos logins: cada login grava um único registro (logins.mpl);
+        # users.json guarda apenas a ordem vigente na última compactação
+        self.users = list(dict.fromkeys(
+            self.load_collection("users") + [login["user"] for login in self.logins]
+        ))
+        self.messages = deque(self.load_collection("messages"), maxlen=HISTORY_LIMIT)
+        self.publications = deque(self.load_collection("publications"), maxlen=HISTORY_LIMIT)
+        self.history_keys = {
+            name: set(map(key, getattr(self, name))) for name, key in HISTORY_KEYS.items()
+        }
+
+        # Conjuntos para busca O(1); as listas mantêm a ordem de inserção
+        self.users_set = set(self.users)
+        self.channels_set = set(self.channels)
+
+        # Um lock por coleção: workers que tocam coleções diferentes não se bloqueiam
+        self.users_lock = Lock()  # users, users_set e logins
+        self.channels_lock = Lock()
+        self.history_locks = {name: Lock() for name in HISTORY_KEYS}
+
+        # Tópicos Pub/Sub já codificados (canais e usuários)
+        self.topics = {}
+
+        # Listas de usuários/canais serializadas: nome -> (tamanho da lista, bytes)
+        self.packed_lists = {}
+        
+        # Logs abertos uma única vez (descritores O_APPEND, sem buffer em espaço de usuário);
+        # apenas a thread de persistência escreve neles
+        self.log_fds = {
+            name: os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            for name, path in self.log_files.items()
+        }
+        self.log_sizes = {name: os.fstat(fd).st_size for name, fd in self.log_fds.items()}
+
+        # Fila da thread de persistência: (coleção, bytes do registro) ou (coleção|None, (Completion, itens))
+        self.write_queue = queue.SimpleQueue()
+        self.unsynced = False
+        self.persist_failed = False  # Falha de escrita/fsync desde o último flush (reportada a ele)
+        self.dir_unsynced = True  # Logs podem ter acabado de ser criados
+        self.last_fsync = time.monotonic()
         
-        print(f"Servidor iniciado. Usuários: {len(self.users)}, Canais: {len(self.channels)}")
+        log(f"Servidor iniciado. Usuários: {len(self.users)}, Canais: {len(self.channels)}")
     
     def increment_clock(self):
         """Incrementa relógio lógico antes de enviar mensagem"""
@@ -80,106 +379,147 @@ class MessageServer:
         """Ajusta o offset do relógio físico"""
         with self.physical_clock_lock:
             self.physical_clock_offset = offset
-            print(f"Relógio físico ajustado. Offset: {offset:.6f}s")
+            log(f"Relógio físico ajustado. Offset: {offset:.6f}s")
     
+    def mark_ready(self):
+        """Sinaliza ao healthcheck que o servidor concluiu a inicialização"""
+        try:
+            READY_FILE.touch()
+        except OSError as e:
+            log(f"Erro ao criar arquivo de prontidão: {e}")
+
+    def peer_address(self, name):
+        """Retorna o endereço servidor-servidor de um par, formatando uma única vez por nome"""
+        address = self.peer_addresses.get(name)
+        if address is None:
+            address = self.peer_addresses[name] = f"tcp://{name}:5561"
+        return address
+
+    def rpc(self, address, request, timeout=2000):
+        """Envia uma requisição REQ/REP reaproveitando um socket ocioso do endereço"""
+        with self.peer_sockets_lock:
+            idle = self.peer_sockets.get(address)
+            sock = idle.pop() if idle else None
+
+        if sock is None:
+            sock = self.context.socket(zmq.REQ)
+            sock.setsockopt(zmq.LINGER, 0)
+            # Par ainda não conectado: o envio espera a conexão (até o timeout) em vez de
+            # deixar a requisição numa fila que o par receberia atrasada
+            sock.setsockopt(zmq.IMMEDIATE, 1)
+            sock.setsockopt(zmq.TCP_KEEPALIVE, 1)
+            sock.connect(address)
+
+        try:
+            sock.setsockopt(zmq.SNDTIMEO, timeout)
+            sock.setsockopt(zmq.RCVTIMEO, timeout)
+            sock.send(thread_packer().pack(request))
+            reply = sock.recv()
+            if reply.startswith(ZSTD_MAGIC):
+                reply = zstandard.ZstdDecompressor().decompress(reply)
+            response = msgpack.unpackb(reply, raw=False)
+        except Exception:
+            # Após timeout/erro o REQ fica fora da sequência send/recv: descartar
+            sock.close()
+            raise
+
+        with self.peer_sockets_lock:
+            self.peer_sockets.setdefault(address, []).append(sock)
+        return response
+
+    def close_peer_sockets(self):
+        """Fecha os sockets REQ ociosos"""
+        with self.peer_sockets_lock:
+            for sockets in self.peer_sockets.values():
+                for sock in sockets:
+                    sock.close()
+            self.peer_sockets.clear()
+
     def register_with_reference(self):
         """Registra servidor com o servidor de referência e obtém rank"""
         try:
-            ref_address = os.getenv("REFERENCE_ADDRESS", "tcp://referencia:5559")
-            ref_socket = self.context.socket(zmq.REQ)
-            ref_socket.connect(ref_address)
-            
             clock = self.increment_clock()
             request = {
                 "service": "rank",
                 "data": {
                     "user": self.server_name,
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "clock": clock
                 }
             }
             
-            ref_socket.send(msgpack.packb(request))
-            response = msgpack.unpackb(ref_socket.recv(), raw=False)
+            response = self.rpc(self.reference_address, request, timeout=-1)
             
             self.rank = response["data"]["rank"]
             self.update_clock(response["data"]["clock"])
             
-            print(f"Servidor '{self.server_name}' registrado com rank {self.rank}")
+            log(f"Servidor '{self.server_name}' registrado com rank {self.rank}")
             
-            ref_socket.close()
             return True
             
         except Exception as e:
-            print(f"Erro ao registrar com referência: {e}")
+            log(f"Erro ao registrar com referência: {e}")
             return False
     
     def send_heartbeat(self):
-        """Thread para enviar heartbeat periódico"""
-        ref_address = os.getenv("REFERENCE_ADDRESS", "tcp://referencia:5559")
-        heartbeat_socket = self.context.socket(zmq.REQ)
-        heartbeat_socket.connect(ref_address)
-        
-        while True:
-            try:
-                time.sleep(5)  # Heartbeat a cada 5 segundos
-                
-                clock = self.increment_clock()
-                request = {
-                    "service": "heartbeat",
-                    "data": {
-                        "user": self.server_name,
-                        "timestamp": datetime.now().isoformat(),
-                        "clock": clock
-                    }
-                }
-                
-                heartbeat_socket.send(msgpack.packb(request))
-                response = msgpack.unpackb(heartbeat_socket.recv(), raw=False)
-                self.update_clock(response["data"]["clock"])
-                
-            except Exception as e:
-                print(f"Erro no heartbeat: {e}")
-                break
+        """Envia um heartbeat sem aguardar a resposta (tratada pelo laço de eventos)"""
+        clock = self.increment_clock()
+        request = {
+            "service": "heartbeat",
+            "data": {
+                "user": self.server_name,
+                "timestamp": time.time_ns(),
+                "clock": clock
+            }
+        }
 
-    def get_servers_list(self):
-        """Obtém lista de servidores do servidor de referência"""
         try:
-            ref_address = os.getenv("REFERENCE_ADDRESS", "tcp://referencia:5559")
-            list_socket = self.context.socket(zmq.REQ)
-            list_socket.connect(ref_address)
+            # DEALER não exige alternância send/recv: uma resposta perdida não trava o socket
+            self.heartbeat_socket.send_multipart([b"", thread_packer().pack(request)], flags=zmq.DONTWAIT)
+        except zmq.Again:
+            log("Erro no heartbeat: servidor de referência não está recebendo")
+
+    def get_servers_list(self):
+        """Obtém lista de servidores do servidor de referência (reaproveitada por SERVERS_LIST_TTL)"""
+        with self.servers_lock:
+            if self.servers_list_time is not None and time.monotonic() - self.servers_list_time < SERVERS_LIST_TTL:
+                return self.servers_list
 
+        try:
             clock = self.increment_clock()
             request = {
                 "service": "list",
                 "data": {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "clock": clock
                 }
             }
 
-            list_socket.send(msgpack.packb(request))
-            response = msgpack.unpackb(list_socket.recv(), raw=False)
+            response = self.rpc(self.reference_address, request, timeout=-1)
 
             self.update_clock(response["data"]["clock"])
 
             with self.servers_lock:
                 self.servers_list = response["data"]["list"]
-
-            list_socket.close()
-            return self.servers_list
+                self.servers_list_time = time.monotonic()
+                return self.servers_list
 
         except Exception as e:
-            print(f"Erro ao obter lista de servidores: {e}")
+            log(f"Erro ao obter lista de servidores: {e}")
             return []
 
+    def invalidate_servers_list(self):
+        """Descarta a lista em cache: a próxima consulta vai à referência"""
+        with self.servers_lock:
+            self.servers_list_time = None
+
     def start_election(self):
         """Inicia processo de eleição (Algoritmo Bully)"""
         if self.in_election:
             return  # Já está em processo de eleição
 
         self.in_election = True
-        print(f"\n[ELEIÇÃO] Iniciando eleição... (Rank: {self.rank})")
+        log(f"\n[ELEIÇÃO] Iniciando eleição... (Rank: {self.rank})")
 
         try:
             # Obter lista de servidores
@@ -193,53 +533,48 @@ class MessageServer:
                 self.become_coordinator()
                 return
 
-            # Enviar mensagem de eleição para servidores com rank maior
-            received_ok = False
-            for server in higher_rank_servers:
-                try:
-                    # Conectar ao servidor
-                    server_address = f"tcp://{server['name']}:5561"
-                    election_socket = self.context.socket(zmq.REQ)
-                    election_socket.setsockopt(zmq.RCVTIMEO, 2000)  # Timeout de 2s
-                    election_socket.connect(server_address)
-
-                    clock = self.increment_clock()
-                    request = {
-                        "service": "election",
-                        "data": {
-                            "timestamp": datetime.now().isoformat(),
-                            "clock": clock
-                        }
-                    }
-
-                    election_socket.send(msgpack.packb(request))
-                    response = msgpack.unpackb(election_socket.recv(), raw=False)
-
-                    if response["data"].get("election") == "OK":
-                        received_ok = True
-                        self.update_clock(response["data"]["clock"])
-
-                    election_socket.close()
-
-                except Exception as e:
-                    print(f"[ELEIÇÃO] Servidor {server['name']} não respondeu: {e}")
-                    continue
+            # Enviar mensagem de eleição para servidores com rank maior (em paralelo)
+            received_ok = any(list(self.peer_pool.map(self._ask_peer_election, higher_rank_servers)))
 
             if not received_ok:
                 # Nenhum servidor com rank maior respondeu - torna-se coordenador
                 self.become_coordinator()
             else:
-                print(f"[ELEIÇÃO] Aguardando coordenador ser anunciado...")
+                log(f"[ELEIÇÃO] Aguardando coordenador ser anunciado...")
 
         finally:
             self.in_election = False
 
+    def _ask_peer_election(self, server):
+        """Envia mensagem de eleição a um servidor; True se ele respondeu OK"""
+        try:
+            clock = self.increment_clock()
+            request = {
+                "service": "election",
+                "data": {
+                    "timestamp": time.time_ns(),
+                    "clock": clock
+                }
+            }
+
+            response = self.rpc(self.peer_address(server["name"]), request)  # Timeout de 2s
+
+            if response["data"].get("election") == "OK":
+                self.update_clock(response["data"]["clock"])
+                return True
+
+        except Exception as e:
+            log(f"[ELEIÇÃO] Servidor {server['name']} não respondeu: {e}")
+
+        return False
+
     def become_coordinator(self):
         """Torna este servidor o coordenador"""
         with self.coordinator_lock:
             self.coordinator = self.server_name
+        self.mark_ready()
 
-        print(f"\n[ELEIÇÃO] '{self.server_name}' é o novo COORDENADOR!\n")
+        log(f"\n[ELEIÇÃO] '{self.server_name}' é o novo COORDENADOR!\n")
 
         # Anunciar para todos os servidores via tópico 'servers'
         clock = self.increment_clock()
@@ -247,30 +582,29 @@ class MessageServer:
             "service": "election",
             "data": {
                 "coordinator": self.server_name,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time_ns(),
                 "clock": clock
             }
         }
 
         # Publicar no tópico 'servers'
-        self.pub_socket.send_string("servers", zmq.SNDMORE)
-        self.pub_socket.send(msgpack.packb(announcement))
+        self.publish(SERVERS_TOPIC, announcement)
 
-        print(f"[ELEIÇÃO] Coordenador anunciado no tópico 'servers'")
+        log(f"[ELEIÇÃO] Coordenador anunciado no tópico 'servers'")
 
     def handle_election_request(self, data):
         """Responde a requisição de eleição de outro servidor"""
         received_clock = data.get("clock", 0)
         current_clock = self.update_clock(received_clock)
 
-        print(f"[ELEIÇÃO] Recebida requisição de eleição")
+        log(f"[ELEIÇÃO] Recebida requisição de eleição")
 
         # Responder OK
         response = {
             "service": "election",
             "data": {
                 "election": "OK",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time_ns(),
                 "clock": current_clock
             }
         }
@@ -292,7 +626,7 @@ class MessageServer:
             "service": "clock",
             "data": {
                 "time": current_time,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time_ns(),
                 "clock": current_clock
             }
         }
@@ -303,7 +637,7 @@ class MessageServer:
             if self.coordinator != self.server_name:
                 return  # Apenas coordenador sincroniza
 
-        print(f"\n[BERKELEY] Iniciando sincronização de relógios...")
+        log(f"\n[BERKELEY] Iniciando sincronização de relógios...")
 
         try:
             servers = self.get_servers_list()
@@ -311,45 +645,14 @@ class MessageServer:
             my_time = self.get_physical_time()
             times.append(my_time)
 
-            # Coletar tempo de todos os servidores
-            for server in servers:
-                if server["name"] == self.server_name:
-                    continue
-
-                try:
-                    server_address = f"tcp://{server['name']}:5561"
-                    clock_socket = self.context.socket(zmq.REQ)
-                    clock_socket.setsockopt(zmq.RCVTIMEO, 2000)
-                    clock_socket.connect(server_address)
-
-                    clock = self.increment_clock()
-                    request = {
-                        "service": "clock",
-                        "data": {
-                            "timestamp": datetime.now().isoformat(),
-                            "clock": clock
-                        }
-                    }
-
-                    clock_socket.send(msgpack.packb(request))
-                    response = msgpack.unpackb(clock_socket.recv(), raw=False)
-
-                    server_time = response["data"]["time"]
-                    times.append(server_time)
-                    self.update_clock(response["data"]["clock"])
-
-                    print(f"[BERKELEY] Tempo de {server['name']}: {server_time:.6f}")
-
-                    clock_socket.close()
-
-                except Exception as e:
-                    print(f"[BERKELEY] Erro ao coletar tempo de {server['name']}: {e}")
-                    continue
+            # Coletar tempo de todos os servidores (em paralelo)
+            peers = [server for server in servers if server["name"] != self.server_name]
+            times.extend(t for t in self.peer_pool.map(self._collect_peer_time, peers) if t is not None)
 
             # Calcular média
             if len(times) > 0:
                 avg_time = sum(times) / len(times)
-                print(f"[BERKELEY] Tempo médio: {avg_time:.6f}")
+                log(f"[BERKELEY] Tempo médio: {avg_time:.6f}")
 
                 # Calcular offset para este servidor
                 my_offset = avg_time - time.time()
@@ -364,7 +667,31 @@ class MessageServer:
                     # Por simplicidade, cada servidor ajusta ao receber tempo médio
 
         except Exception as e:
-            print(f"[BERKELEY] Erro na sincronização: {e}")
+            log(f"[BERKELEY] Erro na sincronização: {e}")
+
+    def _collect_peer_time(self, server):
+        """Obtém o relógio físico de um servidor; None se ele não respondeu"""
+        try:
+            clock = self.increment_clock()
+            request = {
+                "service": "clock",
+                "data": {
+                    "timestamp": time.time_ns(),
+                    "clock": clock
+                }
+            }
+
+            response = self.rpc(self.peer_address(server["name"]), request)
+
+            server_time = response["data"]["time"]
+            self.update_clock(response["data"]["clock"])
+
+            log(f"[BERKELEY] Tempo de {server['name']}: {server_time:.6f}")
+            return server_time
+
+        except Exception as e:
+            log(f"[BERKELEY] Erro ao coletar tempo de {server['name']}: {e}")
+            return None
 
     def request_clock_sync(self):
         """Solicita sincronização de relógio ao coordenador"""
@@ -375,23 +702,17 @@ class MessageServer:
             coordinator_name = self.coordinator
 
         try:
-            coordinator_address = f"tcp://{coordinator_name}:5561"
-            clock_socket = self.context.socket(zmq.REQ)
-            clock_socket.setsockopt(zmq.RCVTIMEO, 2000)
-            clock_socket.connect(coordinator_address)
-
             clock = self.increment_clock()
             request = {
                 "service": "clock",
                 "data": {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "clock": clock
                 }
             }
 
             t1 = time.time()
-            clock_socket.send(msgpack.packb(request))
-            response = msgpack.unpackb(clock_socket.recv(), raw=False)
+            response = self.rpc(self.peer_address(coordinator_name), request)
             t2 = time.time()
 
             coordinator_time = response["data"]["time"]
@@ -403,152 +724,203 @@ class MessageServer:
             self.set_physical_clock_offset(offset)
 
             self.update_clock(response["data"]["clock"])
-            clock_socket.close()
 
         except Exception as e:
-            print(f"[SYNC] Erro ao sincronizar com coordenador: {e}")
+            log(f"[SYNC] Erro ao sincronizar com coordenador: {e}")
             # Coordenador pode estar offline - iniciar eleição
+            self.invalidate_servers_list()
             Thread(target=self.start_election, daemon=True).start()
 
-    def listen_to_servers_topic(self):
-        """Thread para escutar anúncios de eleição no tópico 'servers'"""
-        print(f"[SERVIDOR] Thread listen_to_servers_topic iniciada para {self.server_name}")
+    def event_loop(self, heartbeat=True):
+        """Thread única de eventos: tópico 'servers', respostas de heartbeat e o timer do heartbeat"""
+        log(f"[SERVIDOR] Laço de eventos iniciado para {self.server_name}")
+        poller = zmq.Poller()
+        poller.register(self.sub_socket, zmq.POLLIN)
+        poller.register(self.heartbeat_socket, zmq.POLLIN)
+        next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
+
         while True:
             try:
-                print(f"[SERVIDOR] {self.server_name} aguardando mensagens no tópico 'servers'...")
-                topic, msg = self.sub_socket.recv_multipart()
-                topic_str = topic.decode('utf-8')
+                debug("[SERVIDOR] %s aguardando mensagens no tópico 'servers'...", self.server_name)
+                timeout = max(0.0, next_heartbeat - time.monotonic()) * 1000 if heartbeat else None
+                events = dict(poller.poll(timeout))
 
-                print(f"[SERVIDOR] {self.server_name} recebeu mensagem no tópico '{topic_str}'")
+                if self.sub_socket in events:
+                    self.handle_servers_message(*self.sub_socket.recv_multipart())
 
-                if topic_str == "servers":
-                    data = msgpack.unpackb(msg, raw=False)
-                    service_type = data.get("service")
+                if self.heartbeat_socket in events:
+                    _, reply = self.heartbeat_socket.recv_multipart()
+                    self.update_clock(msgpack.unpackb(reply, raw=False)["data"]["clock"])
 
-                    print(f"[SERVIDOR] {self.server_name} processando service_type: {service_type}")
+                if heartbeat and time.monotonic() >= next_heartbeat:
+                    self.send_heartbeat()
+                    next_heartbeat = time.monotonic() + HEARTBEAT_INTERVAL
 
-                    if service_type == "election":
-                        new_coordinator = data["data"].get("coordinator")
+            except Exception as e:
+                log(f"[ERRO] {self.server_name} - Erro no laço de eventos: {e}")
+                debug_exception()
+                time.sleep(1)
 
-                        if new_coordinator:
-                            with self.coordinator_lock:
-                                self.coordinator = new_coordinator
+    def handle_servers_message(self, topic, msg):
+        """Processa uma mensagem recebida no tópico 'servers'"""
+        debug("[SERVIDOR] %s recebeu mensagem no tópico %r", self.server_name, topic)
 
-                            self.update_clock(data["data"].get("clock", 0))
-                            print(f"\n[ELEIÇÃO] Novo coordenador anunciado: {new_coordinator}\n")
-                            self.in_election = False
+        if topic != SERVERS_TOPIC:
+            return
 
-                    elif service_type == "replication":
-                        print(f"[SERVIDOR] {self.server_name} chamando handle_replication")
-                        # Receber operação de replicação
-                        self.handle_replication(data["data"])
+        data = msgpack.unpackb(msg, raw=False)
+        service_type = data.get("service")
 
-            except Exception as e:
-                print(f"[ERRO] {self.server_name} - Erro ao escutar tópico 'servers': {e}")
-                import traceback
-                traceback.print_exc()
-                time.sleep(1)
+        debug("[SERVIDOR] %s processando service_type: %s", self.server_name, service_type)
 
-    def replicate_operation(self, operation_type, operation_data):
-        """Propaga operação para outros servidores via tópico 'servers'"""
-        try:
-            clock = self.increment_clock()
-            replication_msg = {
-                "service": "replication",
-                "data": {
-                    "server": self.server_name,
-                    "operation": operation_type,
-                    "operation_data": operation_data,
-                    "timestamp": datetime.now().isoformat(),
-                    "clock": clock
-                }
-            }
+        if service_type == "election":
+            new_coordinator = data["data"].get("coordinator")
 
-            # Publicar no tópico 'servers'
-            self.pub_socket.send_string("servers", zmq.SNDMORE)
-            self.pub_socket.send(msgpack.packb(replication_msg))
+            if new_coordinator:
+                with self.coordinator_lock:
+                    self.coordinator = new_coordinator
+                self.mark_ready()
+                self.invalidate_servers_list()  # Troca de coordenador: membros podem ter mudado
 
-        except Exception as e:
-            print(f"[REPLICAÇÃO] ERRO ao propagar {operation_type}: {e}")
-            import traceback
-            traceback.print_exc()
+                self.update_clock(data["data"].get("clock", 0))
+                log(f"\n[ELEIÇÃO] Novo coordenador anunciado: {new_coordinator}\n")
+                self.in_election = False
+
+        elif service_type == "replication":
+            debug("[SERVIDOR] %s chamando handle_replication", self.server_name)
+            # Receber operação de replicação
+            self.handle_replication(data["data"])
+
+        elif service_type == "replication_batch":
+            batch = data["data"]
+            # Próprios lotes também chegam pelo proxy
+            if batch.get("server") == self.server_name:
+                return
+            debug("[SERVIDOR] %s recebeu lote de %d operações", self.server_name, len(batch["ops"]))
+            server = batch["server"]
+            for operation, operation_data, clock in batch["ops"]:
+                self.apply_replication(server, operation, operation_data, clock)
+            self.log_replication_summary(len(batch["ops"]))
+
+    def log_replication_summary(self, count):
+        """Resumo periódico (INFO) das replicações recebidas; o detalhe por operação é DEBUG"""
+        self.replicated_ops += count
+        now = time.monotonic()
+        elapsed = now - self.replication_log_time
+        if elapsed >= REPLICATION_LOG_INTERVAL:
+            log(f"[REPLICAÇÃO] {self.replicated_ops} operações recebidas de outros servidores "
+                f"nos últimos {elapsed:.0f}s")
+            self.replicated_ops = 0
+            self.replication_log_time = now
+
+    def replicate_operation(self, operation_type, operation_data, wait=False):
+        """Enfileira operação para propagação aos outros servidores (enviada no próximo lote).
+        Com wait=True, retorna só depois do fsync local e do envio do lote com a operação ao
+        socket PUB, e False se um dos dois falhou ou não terminou a tempo."""
+        if wait and not self.flush_records():  # Group commit: um fsync atende todo o lote
+            return False
+
+        clock = self.increment_clock()
+        done = Completion() if wait else None
+        # Posicional [operação, dados, clock]: o servidor de origem vai uma vez no lote
+        self.replication_queue.put(((operation_type, operation_data, clock), done))
+        if done and not done.wait(REPLICATION_SYNC_TIMEOUT):
+            log(f"[REPLICAÇÃO] Publicação de {operation_type} não confirmada")
+            return False
+        return True
+
+    def replication_loop(self):
+        """Thread que agrupa as operações de cada janela numa única publicação no tópico 'servers'"""
+        window = REPLICATION_BATCH_INTERVAL
+        while True:
+            items = [self.replication_queue.get()]  # Bloqueia enquanto não há operações
+            deadline = time.monotonic() + window
+            while len(items) < REPLICATION_BATCH_MAX:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        items.append(self.replication_queue.get(timeout=remaining))
+                    else:
+                        items.append(self.replication_queue.get_nowait())
+                except queue.Empty:
+                    break
+            # Lote cheio indica fila acumulada: o próximo sai sem esperar a janela
+            window = 0 if len(items) >= REPLICATION_BATCH_MAX else REPLICATION_BATCH_INTERVAL
+            ops = [op for op, _ in items]
+
+            try:
+                self.publish(SERVERS_TOPIC, {
+                    "service": "replication_batch",
+                    "data": {
+                        "server": self.server_name,
+                        "ops": ops
+                    }
+                })
+                published = True
+            except Exception as e:
+                log(f"[REPLICAÇÃO] ERRO ao propagar lote de {len(ops)} operações: {e}")
+                debug_exception()
+                published = False
+
+            # Liberar quem pediu replicação síncrona, com o resultado do envio
+            for _, done in items:
+                if done:
+                    done.finish(published)
 
     def handle_replication(self, data):
-        """Processa operação de replicação recebida de outro servidor"""
-        try:
-            server = data.get("server")
-            operation = data.get("operation")
-            operation_data = data.get("operation_data")
-            received_clock = data.get("clock", 0)
+        """Processa operação de replicação avulsa (formato com chaves) recebida de outro servidor"""
+        self.apply_replication(
+            data.get("server"), data.get("operation"), data.get("operation_data"), data.get("clock", 0)
+        )
 
+    def apply_replication(self, server, operation, operation_data, received_clock):
+        """Aplica uma operação de replicação recebida de outro servidor"""
+        try:
             # Ignorar próprias operações
             if server == self.server_name:
                 return
 
-            print(f"[REPLICAÇÃO] {operation} de {server}: {operation_data}")
+            debug("[REPLICAÇÃO] %s de %s: %s", operation, server, operation_data)
 
             # Atualizar relógio lógico
             self.update_clock(received_clock)
 
             # Aplicar operação baseada no tipo
-            if operation == "login":
-                self._apply_login_replication(operation_data)
-            elif operation == "channel":
-                self._apply_channel_replication(operation_data)
-            elif operation == "publish":
-                self._apply_publish_replication(operation_data)
-            elif operation == "message":
-                self._apply_message_replication(operation_data)
+            handler = self.REPLICATION_HANDLERS.get(operation)
+            if handler:
+                handler(self, operation_data)
 
         except Exception as e:
-            print(f"[REPLICAÇÃO] ERRO ao processar {operation}: {e}")
-            import traceback
-            traceback.print_exc()
+            log(f"[REPLICAÇÃO] ERRO ao processar {operation}: {e}")
+            debug_exception()
 
     def _apply_login_replication(self, data):
         """Aplica replicação de login"""
         user = data.get("user")
         timestamp = data.get("timestamp")
 
-        if user and user not in self.users:
-            self.users.append(user)
-            users_data = {
-                "service": "users",
-                "data": {
-                    "timestamp": datetime.now().isoformat(),
-                    "users": self.users
-                }
-            }
-            self.save_data(self.users_file, users_data)
+        with self.users_lock:
+            if user and user not in self.users_set:
+                self.users.append(user)
+                self.users_set.add(user)
 
-            # Registrar login
-            self.logins.append({
-                "user": user,
-                "timestamp": timestamp
-            })
-            logins_data = {
-                "service": "login",
-                "data": {
-                    "timestamp": datetime.now().isoformat(),
-                    "logins": self.logins
+                # Registrar login (o registro também persiste o usuário)
+                login = {
+                    "user": user,
+                    "timestamp": timestamp
                 }
-            }
-            self.save_data(self.logins_file, logins_data)
+                self.logins.append(login)
+                self.append_record("logins", login)
 
     def _apply_channel_replication(self, data):
         """Aplica replicação de criação de canal"""
         channel = data.get("channel")
 
-        if channel and channel not in self.channels:
-            self.channels.append(channel)
-            channels_data = {
-                "service": "channels",
-                "data": {
-                    "timestamp": datetime.now().isoformat(),
-                    "users": self.channels
-                }
-            }
-            self.save_data(self.channels_file, channels_data)
+        with self.channels_lock:
+            if channel and channel not in self.channels_set:
+                self.channels.append(channel)
+                self.channels_set.add(channel)
+                self.append_record("channels", channel)
 
     def _apply_publish_replication(self, data):
         """Aplica replicação de publicação"""
@@ -558,31 +930,14 @@ class MessageServer:
         timestamp = data.get("timestamp")
         clock = data.get("clock")
 
-        # Verificar se já existe (evitar duplicação)
-        exists = any(
-            p.get("channel") == channel and
-            p.get("user") == user and
-            p.get("message") == message and
-            p.get("timestamp") == timestamp
-            for p in self.publications
-        )
-
-        if not exists:
-            self.publications.append({
-                "channel": channel,
-                "user": user,
-                "message": message,
-                "timestamp": timestamp,
-                "clock": clock
-            })
-            publications_data = {
-                "service": "publish",
-                "data": {
-                    "timestamp": datetime.now().isoformat(),
-                    "publications": self.publications
-                }
-            }
-            self.save_data(self.publications_file, publications_data)
+        # add_history ignora duplicatas (evitar duplicação)
+        self.add_history("publications", {
+            "channel": channel,
+            "user": user,
+            "message": message,
+            "timestamp": timestamp,
+            "clock": clock
+        })
 
     def _apply_message_replication(self, data):
         """Aplica replicação de mensagem privada"""
@@ -592,31 +947,22 @@ class MessageServer:
         timestamp = data.get("timestamp")
         clock = data.get("clock")
 
-        # Verificar se já existe (evitar duplicação)
-        exists = any(
-            m.get("src") == src and
-            m.get("dst") == dst and
-            m.get("message") == message and
-            m.get("timestamp") == timestamp
-            for m in self.messages
-        )
+        # add_history ignora duplicatas (evitar duplicação)
+        self.add_history("messages", {
+            "src": src,
+            "dst": dst,
+            "message": message,
+            "timestamp": timestamp,
+            "clock": clock
+        })
 
-        if not exists:
-            self.messages.append({
-                "src": src,
-                "dst": dst,
-                "message": message,
-                "timestamp": timestamp,
-                "clock": clock
-            })
-            messages_data = {
-                "service": "message",
-                "data": {
-                    "timestamp": datetime.now().isoformat(),
-                    "messages": self.messages
-                }
-            }
-            self.save_data(self.messages_file, messages_data)
+    # Aplicação de replicação por tipo de operação (montado uma vez, na definição da classe)
+    REPLICATION_HANDLERS = {
+        "login": _apply_login_replication,
+        "channel": _apply_channel_replication,
+        "publish": _apply_publish_replication,
+        "message": _apply_message_replication
+    }
 
     def request_full_sync(self):
         """Solicita sincronização completa de dados de outro servidor"""
@@ -629,128 +975,120 @@ class MessageServer:
                     continue
 
                 try:
-                    server_address = f"tcp://{server['name']}:5561"
-                    sync_socket = self.context.socket(zmq.REQ)
-                    sync_socket.setsockopt(zmq.RCVTIMEO, 5000)
-                    sync_socket.connect(server_address)
-
                     clock = self.increment_clock()
                     request = {
                         "service": "sync",
                         "data": {
-                            "timestamp": datetime.now().isoformat(),
+                            "compression": "zstd",
+                            "timestamp": time.time_ns(),
                             "clock": clock
                         }
                     }
 
-                    sync_socket.send(msgpack.packb(request))
-                    response = msgpack.unpackb(sync_socket.recv(), raw=False)
+                    response = self.rpc(self.peer_address(server["name"]), request, timeout=5000)
 
                     # Aplicar dados recebidos
                     self._apply_full_sync(response["data"])
                     self.update_clock(response["data"]["clock"])
 
-                    sync_socket.close()
-                    print(f"[SYNC] Sincronização completa realizada com {server['name']}")
+                    log(f"[SYNC] Sincronização completa realizada com {server['name']}")
                     return True
 
                 except Exception as e:
-                    print(f"[SYNC] Erro ao sincronizar com {server['name']}: {e}")
+                    log(f"[SYNC] Erro ao sincronizar com {server['name']}: {e}")
                     continue
 
             return False
 
         except Exception as e:
-            print(f"[SYNC] Erro na sincronização completa: {e}")
+            log(f"[SYNC] Erro na sincronização completa: {e}")
             return False
 
     def _apply_full_sync(self, data):
         """Aplica dados recebidos de sincronização completa"""
-        # Mesclar usuários
-        remote_users = data.get("users", [])
-        for user in remote_users:
-            if user not in self.users:
-                self.users.append(user)
+        # Apenas itens remotos desconhecidos são adicionados e vão para o log append-only
+        # Cada coleção é mesclada de uma vez: extend/update e um único item na fila de persistência
+        with self.users_lock:
+            # Mesclar logins (duplicatas mantêm o mais antigo)
+            login_keys = {(login["user"], login["timestamp"]) for login in self.logins}
+            new_logins = []
+            for login in data.get("logins", []):
+                key = (login["user"], login["timestamp"])
+                if key not in login_keys:
+                    login_keys.add(key)
+                    new_logins.append(login)
+            self.logins.extend(new_logins)
+            self.append_records("logins", new_logins)
+
+            # Mesclar usuários (dict.fromkeys também remove repetições vindas do remoto).
+            # Usuário com login já persiste via logins.mpl: users.mpl só recebe os sem login,
+            # senão o mesmo usuário ficaria em dois logs
+            new_users = [user for user in dict.fromkeys(data.get("users", [])) if user not in self.users_set]
+            self.users.extend(new_users)
+            self.users_set.update(new_users)
+            login_users = {user for user, _ in login_keys}
+            self.append_records("users", [user for user in new_users if user not in login_users])
 
         # Mesclar canais
-        remote_channels = data.get("channels", [])
-        for channel in remote_channels:
-            if channel not in self.channels:
-                self.channels.append(channel)
-
-        # Mesclar logins (ordenar por timestamp)
-        remote_logins = data.get("logins", [])
-        all_logins = self.logins + remote_logins
-        # Remover duplicatas mantendo o mais antigo
-        seen = {}
-        for login in all_logins:
-            key = (login["user"], login["timestamp"])
-            if key not in seen:
-                seen[key] = login
-        self.logins = list(seen.values())
-
-        # Mesclar mensagens (ordenar por clock)
-        remote_messages = data.get("messages", [])
-        all_messages = self.messages + remote_messages
-        seen_messages = {}
-        for msg in all_messages:
-            key = (msg["src"], msg["dst"], msg["message"], msg["timestamp"])
-            if key not in seen_messages:
-                seen_messages[key] = msg
-        self.messages = list(seen_messages.values())
-        self.messages.sort(key=lambda x: x.get("clock", 0))
-
-        # Mesclar publicações (ordenar por clock)
-        remote_publications = data.get("publications", [])
-        all_publications = self.publications + remote_publications
-        seen_pubs = {}
-        for pub in all_publications:
-            key = (pub["channel"], pub["user"], pub["message"], pub["timestamp"])
-            if key not in seen_pubs:
-                seen_pubs[key] = pub
-        self.publications = list(seen_pubs.values())
-        self.publications.sort(key=lambda x: x.get("clock", 0))
-
-        # Salvar tudo
-        self.save_data(self.users_file, {
-            "service": "users",
-            "data": {"timestamp": datetime.now().isoformat(), "users": self.users}
-        })
-        self.save_data(self.channels_file, {
-            "service": "channels",
-            "data": {"timestamp": datetime.now().isoformat(), "users": self.channels}
-        })
-        self.save_data(self.logins_file, {
-            "service": "login",
-            "data": {"timestamp": datetime.now().isoformat(), "logins": self.logins}
-        })
-        self.save_data(self.messages_file, {
-            "service": "message",
-            "data": {"timestamp": datetime.now().isoformat(), "messages": self.messages}
-        })
-        self.save_data(self.publications_file, {
-            "service": "publish",
-            "data": {"timestamp": datetime.now().isoformat(), "publications": self.publications}
-        })
+        with self.channels_lock:
+            new_channels = [
+                channel for channel in dict.fromkeys(data.get("channels", []))
+                if channel not in self.channels_set
+            ]
+            self.channels.extend(new_channels)
+            self.channels_set.update(new_channels)
+            self.append_records("channels", new_channels)
+
+        # Mesclar mensagens e publicações com o histórico completo em disco (ordenar por clock).
+        # O lock fica retido até a compactação para nenhum registro novo cair no log truncado.
+        for name, key in HISTORY_KEYS.items():
+            with self.history_locks[name]:
+                self.flush_records()
+                stored = self.load_collection(name)
+                stored_keys = set(map(key, stored))
+                new_items = []
+                for item in data.get(name, []):
+                    item_key = key(item)
+                    if item_key not in stored_keys:
+                        stored_keys.add(item_key)
+                        new_items.append(item)
+                if not new_items:
+                    continue  # Nada novo: histórico em disco e em memória já estão corretos
+
+                # Histórico quase ordenado: o sort (Timsort) fica perto de linear
+                stored.extend(new_items)
+                stored.sort(key=lambda x: x.get("clock", 0))
+                setattr(self, name, deque(stored, maxlen=HISTORY_LIMIT))
+                self.history_keys[name] = set(map(key, getattr(self, name)))
+                self.compact(name, stored)
 
     def handle_sync_request(self, data):
         """Responde a requisição de sincronização completa"""
         received_clock = data.get("clock", 0)
         current_clock = self.update_clock(received_clock)
 
-        return {
+        # Histórico completo de mensagens/publicações vem do disco (memória guarda só o recente)
+        self.flush_records()
+
+        response = {
             "service": "sync",
             "data": {
                 "users": self.users,
                 "channels": self.channels,
                 "logins": self.logins,
-                "messages": self.messages,
-                "publications": self.publications,
-                "timestamp": datetime.now().isoformat(),
+                "messages": self.load_collection("messages"),
+                "publications": self.load_collection("publications"),
+                "timestamp": time.time_ns(),
                 "clock": current_clock
             }
         }
 
+        # Solicitantes antigos não enviam "compression" e recebem msgpack puro
+        if data.get("compression") == "zstd":
+            compressor = zstandard.ZstdCompressor(level=SYNC_COMPRESSION_LEVEL)
+            return compressor.compress(thread_packer().pack(response))
+        return response
+
     def handle_who_coordinator(self, data):
         """Responde quem é o coordenador atual"""
         received_clock = data.get("clock", 0)
@@ -765,7 +1103,7 @@ class MessageServer:
                 "coordinator": coordinator,
                 "my_rank": self.rank,
                 "my_name": self.server_name,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": time.time_ns(),
                 "clock": current_clock
             }
         }
@@ -774,24 +1112,240 @@ class MessageServer:
         """Carrega dados do arquivo JSON"""
         if file_path.exists():
             try:
-                with open(file_path, 'r') as f:
-                    content = json.load(f)
+                with open(file_path, 'rb') as f:
+                    content = orjson.loads(f.read())
                     # Se o arquivo tem formato estruturado, extrair os dados
                     if isinstance(content, dict) and 'data' in content and data_key:
                         return content['data'].get(data_key, default)
                     return content if not data_key else default
             except Exception as e:
-                print(f"Erro ao carregar {file_path}: {e}")
+                log(f"Erro ao carregar {file_path}: {e}")
                 return default
         return default
     
-    def save_data(self, file_path, data):
-        """Salva dados no arquivo JSON"""
+    def save_data(self, file_path, data, durable=False):
+        """Salva dados no arquivo JSON (escreve em arquivo temporário e renomeia atomicamente)"""
         try:
-            with open(file_path, 'w') as f:
-                json.dump(data, f, indent=2)
+            tmp_path = file_path.with_suffix(file_path.suffix + ".tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(orjson.dumps(data))
+                if durable:
+                    f.flush()
+                    fdatasync(f.fileno())
+            os.replace(tmp_path, file_path)
+            self.dir_unsynced = True
+            if durable:
+                return self.sync_dir()
+            return True
+        except Exception as e:
+            log(f"Erro ao salvar {file_path}: {e}")
+            return False
+
+    def sync_dir(self):
+        """fsync do diretório de dados: torna duráveis renomeações e criações de arquivos"""
+        try:
+            dir_fd = os.open(self.data_dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            self.dir_unsynced = False
+            return True
         except Exception as e:
-            print(f"Erro ao salvar {file_path}: {e}")
+            log(f"Erro ao sincronizar {self.data_dir}: {e}")
+            return False
+
+    def load_collection(self, name):
+        """Carrega uma coleção: snapshot JSON seguido dos registros do log append-only"""
+        _, data_key = COLLECTIONS[name]
+        items = self.load_data(self.snapshot_files[name], [], data_key)
+
+        log_path = self.log_files[name]
+        if log_path.exists():
+            try:
+                records, valid_size = read_frames(log_path)
+                items.extend(records)
+                if valid_size < log_path.stat().st_size:
+                    # Escrita interrompida: descartar o frame incompleto para os próximos appends
+                    log(f"Frame incompleto descartado no fim de {log_path}")
+                    os.truncate(log_path, valid_size)
+            except Exception as e:
+                log(f"Erro ao carregar {log_path}: {e}")
+
+        if name in ("users", "channels"):
+            # Compactação interrompida pode repetir registros já presentes no snapshot
+            items = list(dict.fromkeys(items))
+        return items
+
+    def append_record(self, name, record):
+        """Enfileira um registro para o log da coleção (gravado pela thread de persistência)"""
+        self.write_queue.put((name, frame_record(record)))
+
+    def append_records(self, name, records):
+        """Enfileira vários registros da coleção como um único bloco de frames"""
+        if records:
+            self.write_queue.put((name, b"".join(map(frame_record, records))))
+
+    def add_history(self, name, record):
+        """Guarda mensagem/publicação entre as recentes e a enfileira para o log (False se duplicada)"""
+        key = HISTORY_KEYS[name]
+        record_key = key(record)
+        with self.history_locks[name]:
+            keys = self.history_keys[name]
+            if record_key in keys:
+                return False
+
+            items = getattr(self, name)
+            if len(items) == items.maxlen:
+                keys.discard(key(items[0]))  # O mais antigo sai da memória (continua em disco)
+            items.append(record)
+            keys.add(record_key)
+            self.append_record(name, record)
+        return True
+
+    def compact(self, name, items=None):
+        """Pede à thread de persistência que reescreva o snapshot da coleção e esvazie seu log.
+        Retorna False se a compactação falhou ou não terminou dentro de PERSIST_WAIT_TIMEOUT."""
+        done = Completion()
+        self.write_queue.put((name, (done, items)))
+        if not done.wait(PERSIST_WAIT_TIMEOUT):
+            log(f"[PERSISTÊNCIA] Compactação de {name} não confirmada")
+            return False
+        return True
+
+    def flush_records(self):
+        """Aguarda a gravação e o fsync de todos os registros enfileirados.
+        Retorna False se alguma escrita ou fsync falhou ou se a thread não concluiu
+        dentro de PERSIST_WAIT_TIMEOUT."""
+        done = Completion()
+        self.write_queue.put((None, (done, None)))
+        if not done.wait(PERSIST_WAIT_TIMEOUT):
+            log("[PERSISTÊNCIA] Gravação dos registros não confirmada")
+            return False
+        return True
+
+    def persistence_loop(self):
+        """Thread dona dos arquivos de persistência: grava em lote tudo o que estiver na fila"""
+        while True:
+            try:
+                batch = [self.write_queue.get(timeout=PERSIST_FSYNC_INTERVAL)]
+            except queue.Empty:
+                try:
+                    self.sync_logs()
+                except Exception as e:
+                    log(f"[PERSISTÊNCIA] Erro ao sincronizar logs: {e}")
+                    debug_exception()
+                continue
+
+            while True:
+                try:
+                    batch.append(self.write_queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                # Uma falha não pode encerrar a única thread de escrita
+                log(f"[PERSISTÊNCIA] Erro ao gravar lote de {len(batch)} itens: {e}")
+                debug_exception()
+            finally:
+                # Ninguém fica bloqueado esperando um lote que falhou (e ninguém recebe sucesso)
+                for _, item in batch:
+                    if not isinstance(item, bytes) and not item[0].event.is_set():
+                        item[0].finish(False)
+
+    def write_batch(self, batch):
+        """Grava um lote da fila: registros, compactações e flushes (group commit)"""
+        pending = {}
+        flushes = []
+        for name, item in batch:
+            if isinstance(item, bytes):
+                pending.setdefault(name, []).append(item)
+                continue
+
+            done, items = item
+            if name is None:
+                # Flush: atendido no fim do lote, com um único fsync para todos (group commit)
+                flushes.append(done)
+                continue
+
+            # Compactação: gravar antes o que veio antes dela na fila
+            self.write_pending(pending)
+            pending = {}
+            done.finish(self.compact_collection(name, items))
+
+        self.write_pending(pending)
+        self.sync_logs(force=bool(flushes))
+        if flushes:
+            # Sucesso só se nada falhou desde o flush anterior (registros podem ter vindo em outro lote)
+            ok = not self.persist_failed
+            self.persist_failed = False
+            for done in flushes:
+                done.finish(ok)
+
+    def write_pending(self, pending):
+        """Uma escrita por arquivo de log"""
+        for name, lines in pending.items():
+            chunk = b"".join(lines)
+            try:
+                fd = self.log_fds[name]
+                written = 0
+                while written < len(chunk):
+                    written += os.write(fd, chunk[written:])
+                self.log_sizes[name] += len(chunk)
+                self.unsynced = True
+            except Exception as e:
+                log(f"Erro ao salvar {self.log_files[name]}: {e}")
+                self.persist_failed = True
+                continue
+
+            if self.log_sizes[name] > LOG_COMPACT_BYTES:
+                self.compact_collection(name)
+                if name == "logins":
+                    self.compact_collection("users")
+
+    def sync_logs(self, force=False):
+        """fdatasync dos logs no máximo a cada PERSIST_FSYNC_INTERVAL (ou imediatamente se force)"""
+        now = time.monotonic()
+        if not (self.unsynced or self.dir_unsynced):
+            return
+        if not force and now - self.last_fsync < PERSIST_FSYNC_INTERVAL:
+            return
+        if self.unsynced:
+            for name, fd in self.log_fds.items():
+                try:
+                    # fdatasync não força a gravação de metadados irrelevantes (ex.: mtime)
+                    fdatasync(fd)
+                except Exception as e:
+                    log(f"Erro ao sincronizar {self.log_files[name]}: {e}")
+                    self.persist_failed = True
+            self.unsynced = False
+        if self.dir_unsynced and not self.sync_dir():
+            self.persist_failed = True
+        self.last_fsync = now
+
+    def compact_collection(self, name, items=None):
+        """Reescreve o snapshot da coleção e esvazia seu log (False se o snapshot não foi salvo)"""
+        if items is None:
+            # O snapshot parte do que já está em disco, não das listas em memória: registros
+            # cujos frames ainda estão na fila seriam anexados de novo após o snapshot
+            # (o histórico, além disso, só tem os recentes em memória)
+            items = self.load_collection(name)
+        service, data_key = COLLECTIONS[name]
+        snapshot = {
+            "service": service,
+            "data": {
+                "timestamp": datetime.now().isoformat(),
+                data_key: items
+            }
+        }
+        # O log só pode ser esvaziado depois que o novo snapshot estiver durável
+        if not self.save_data(self.snapshot_files[name], snapshot, durable=True):
+            return False
+        os.ftruncate(self.log_fds[name], 0)
+        self.log_sizes[name] = 0
+        return True
     
     def handle_login(self, data):
         """Processa login de usuário"""
@@ -801,65 +1355,39 @@ class MessageServer:
         
         # Atualizar relógio lógico
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
         if not user:
-            return {
-                "service": "login",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "description": "Nome de usuário não fornecido",
-                    "clock": current_clock
-                }
-            }
-        
-        # Verificar se usuário já existe
-        if user in self.users:
-            return {
-                "service": "login",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "description": "Usuário já cadastrado",
-                    "clock": current_clock
-                }
-            }
+            return error_response("no_user", now, current_clock)
         
-        # Adicionar usuário
-        self.users.append(user)
-        users_data = {
-            "service": "users",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "users": self.users
-            }
-        }
-        self.save_data(self.users_file, users_data)
+        with self.users_lock:
+            # Verificar se usuário já existe
+            if user in self.users_set:
+                return error_response("user_exists", now, current_clock)
 
-        # Registrar login
-        self.logins.append({
-            "user": user,
-            "timestamp": timestamp
-        })
-        logins_data = {
-            "service": "login",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "logins": self.logins
+            # Adicionar usuário
+            self.users.append(user)
+            self.users_set.add(user)
+
+            # Registrar login (o registro também persiste o usuário)
+            login = {
+                "user": user,
+                "timestamp": timestamp
             }
-        }
-        self.save_data(self.logins_file, logins_data)
+            self.logins.append(login)
+            self.append_record("logins", login)
 
-        print(f"Login: {user} ({timestamp}) - Clock: {current_clock}")
+        log(f"Login: {user} ({timestamp}) - Clock: {current_clock}")
 
-        # Replicar operação para outros servidores (síncrono)
-        self.replicate_operation("login", {"user": user, "timestamp": timestamp})
+        # Replicar operação para outros servidores (em lote; "sync" aguarda o fsync e o envio do lote ao socket PUB)
+        if not self.replicate_operation("login", {"user": user, "timestamp": timestamp}, wait=data.get("sync", False)):
+            return error_response("login_not_synced", now, current_clock)
 
         return {
             "service": "login",
             "data": {
                 "status": "sucesso",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
                 "clock": current_clock
             }
         }
@@ -868,15 +1396,9 @@ class MessageServer:
         """Retorna lista de usuários"""
         received_clock = data.get("clock", 0)
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
-        return {
-            "service": "users",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "users": self.users,
-                "clock": current_clock
-            }
-        }
+        return list_response("users", now, self.packed_list("users"), current_clock)
     
     def handle_channel(self, data):
         """Cria novo canal"""
@@ -885,51 +1407,32 @@ class MessageServer:
         received_clock = data.get("clock", 0)
         
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
         if not channel:
-            return {
-                "service": "channel",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "description": "Nome do canal não fornecido",
-                    "clock": current_clock
-                }
-            }
+            return error_response("no_channel", now, current_clock)
         
-        # Verificar se canal já existe
-        if channel in self.channels:
-            return {
-                "service": "channel",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "description": "Canal já existe",
-                    "clock": current_clock
-                }
-            }
-        
-        # Adicionar canal
-        self.channels.append(channel)
-        channels_data = {
-            "service": "channels",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "users": self.channels
-            }
-        }
-        self.save_data(self.channels_file, channels_data)
+        with self.channels_lock:
+            # Verificar se canal já existe
+            if channel in self.channels_set:
+                return error_response("channel_exists", now, current_clock)
+
+            # Adicionar canal
+            self.channels.append(channel)
+            self.channels_set.add(channel)
+            self.append_record("channels", channel)
 
-        print(f"Canal criado: {channel} ({timestamp}) - Clock: {current_clock}")
+        log(f"Canal criado: {channel} ({timestamp}) - Clock: {current_clock}")
 
-        # Replicar operação para outros servidores (síncrono)
-        self.replicate_operation("channel", {"channel": channel})
+        # Replicar operação para outros servidores (em lote; "sync" aguarda o fsync e o envio do lote ao socket PUB)
+        if not self.replicate_operation("channel", {"channel": channel}, wait=data.get("sync", False)):
+            return error_response("channel_not_synced", now, current_clock)
 
         return {
             "service": "channel",
             "data": {
                 "status": "sucesso",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
                 "clock": current_clock
             }
         }
@@ -938,15 +1441,9 @@ class MessageServer:
         """Retorna lista de canais"""
         received_clock = data.get("clock", 0)
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
-        return {
-            "service": "channels",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "users": self.channels,
-                "clock": current_clock
-            }
-        }
+        return list_response("channels", now, self.packed_list("channels"), current_clock)
     
     def handle_publish(self, data):
         """Publica mensagem em canal"""
@@ -957,29 +1454,14 @@ class MessageServer:
         received_clock = data.get("clock", 0)
         
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
         if not channel or not message:
-            return {
-                "service": "publish",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Canal ou mensagem não fornecidos",
-                    "clock": current_clock
-                }
-            }
+            return error_response("publish_missing", now, current_clock)
         
         # Verificar se canal existe
-        if channel not in self.channels:
-            return {
-                "service": "publish",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Canal não existe",
-                    "clock": current_clock
-                }
-            }
+        if channel not in self.channels_set:
+            return error_response("unknown_channel", now, current_clock)
         
         # Publicar no canal (tópico = nome do canal)
         pub_clock = self.increment_clock()
@@ -991,41 +1473,28 @@ class MessageServer:
         }
         
         # Enviar para o proxy Pub/Sub (MessagePack)
-        topic = channel
-        self.pub_socket.send_string(topic, zmq.SNDMORE)
-        self.pub_socket.send(msgpack.packb(publication))
+        self.publish(self.topic_for(channel), publication)
         
         # Persistir publicação
-        self.publications.append({
+        stored_publication = {
             "channel": channel,
             "user": user,
             "message": message,
             "timestamp": timestamp,
             "clock": pub_clock
-        })
-        publications_data = {
-            "service": "publish",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "publications": self.publications
-            }
         }
-        self.save_data(self.publications_file, publications_data)
+        self.add_history("publications", stored_publication)
 
-        # Replicar operação para outros servidores (síncrono)
-        self.replicate_operation("publish", {
-            "channel": channel,
-            "user": user,
-            "message": message,
-            "timestamp": timestamp,
-            "clock": pub_clock
-        })
+        # Replicar operação para outros servidores (em lote; "sync" aguarda o fsync e o envio do lote ao socket PUB).
+        # O registro persistido já tem exatamente os campos da replicação e não é mais alterado
+        if not self.replicate_operation("publish", stored_publication, wait=data.get("sync", False)):
+            return error_response("publish_not_synced", now, current_clock)
 
         return {
             "service": "publish",
             "data": {
                 "status": "OK",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
                 "clock": current_clock
             }
         }
@@ -1039,29 +1508,14 @@ class MessageServer:
         received_clock = data.get("clock", 0)
         
         current_clock = self.update_clock(received_clock)
+        now = iso_now()
         
         if not dst or not message:
-            return {
-                "service": "message",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Destinatário ou mensagem não fornecidos",
-                    "clock": current_clock
-                }
-            }
+            return error_response("message_missing", now, current_clock)
         
         # Verificar se usuário existe
-        if dst not in self.users:
-            return {
-                "service": "message",
-                "data": {
-                    "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
-                    "message": "Usuário não existe",
-                    "clock": current_clock
-                }
-            }
+        if dst not in self.users_set:
+            return error_response("unknown_user", now, current_clock)
         
         # Publicar para o usuário (tópico = nome do usuário)
         msg_clock = self.increment_clock()
@@ -1073,47 +1527,71 @@ class MessageServer:
         }
         
         # Enviar para o proxy Pub/Sub (MessagePack)
-        topic = dst
-        self.pub_socket.send_string(topic, zmq.SNDMORE)
-        self.pub_socket.send(msgpack.packb(private_message))
+        self.publish(self.topic_for(dst), private_message)
         
         # Persistir mensagem
-        self.messages.append({
+        stored_message = {
             "src": src,
             "dst": dst,
             "message": message,
             "timestamp": timestamp,
             "clock": msg_clock
-        })
-        messages_data = {
-            "service": "message",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "messages": self.messages
-            }
         }
-        self.save_data(self.messages_file, messages_data)
+        self.add_history("messages", stored_message)
 
-        print(f"Mensagem de {src} para {dst}: {message} - Clock: {msg_clock}")
+        debug("Mensagem de %s para %s: %s - Clock: %s", src, dst, message, msg_clock)
 
-        # Replicar operação para outros servidores (síncrono)
-        self.replicate_operation("message", {
-            "src": src,
-            "dst": dst,
-            "message": message,
-            "timestamp": timestamp,
-            "clock": msg_clock
-        })
+        # Replicar operação para outros servidores (em lote; "sync" aguarda o fsync e o envio do lote ao socket PUB).
+        # O registro persistido já tem exatamente os campos da replicação e não é mais alterado
+        if not self.replicate_operation("message", stored_message, wait=data.get("sync", False)):
+            return error_response("message_not_synced", now, current_clock)
 
         return {
             "service": "message",
             "data": {
                 "status": "OK",
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now,
                 "clock": current_clock
             }
         }
     
+    # Roteamento de serviços (montado uma vez, na definição da classe)
+    HANDLERS = {
+        "login": handle_login,
+        "users": handle_users,
+        "channel": handle_channel,
+        "channels": handle_channels,
+        "publish": handle_publish,
+        "message": handle_message,
+        "election": handle_election_request,
+        "clock": handle_clock_request,
+        "sync": handle_sync_request,
+        "who_coordinator": handle_who_coordinator
+    }
+
+    def packed_list(self, name):
+        """Lista serializada em cache; como as listas só crescem, o tamanho invalida o cache"""
+        items = getattr(self, name)
+        size = len(items)
+        cached = self.packed_lists.get(name)
+        if cached is None or cached[0] != size:
+            cached = self.packed_lists[name] = (size, thread_packer().pack(items[:size]))
+        return cached[1]
+
+    def publish(self, topic, payload):
+        """Publica sem bloquear. Com o HWM cheio o socket PUB descarta a mensagem em silêncio
+        (PUB nunca retorna EAGAIN): a entrega não é confirmada"""
+        with self.pub_lock:
+            packed = self.pub_packer.pack(payload)
+            self.pub_socket.send_multipart([topic, packed], flags=zmq.DONTWAIT, copy=False)
+
+    def topic_for(self, name):
+        """Retorna o tópico Pub/Sub codificado, codificando uma única vez por nome"""
+        topic = self.topics.get(name)
+        if topic is None:
+            topic = self.topics[name] = name.encode('utf-8')
+        return topic
+
     def process_request(self, message):
         """Processa requisição recebida"""
         try:
@@ -1122,156 +1600,203 @@ class MessageServer:
             service = request.get("service")
             data = request.get("data", {})
             
-            print(f"Requisição recebida: {service}")
+            debug("Requisição recebida: %s", service)
             
             # Roteamento de serviços
-            handlers = {
-                "login": self.handle_login,
-                "users": self.handle_users,
-                "channel": self.handle_channel,
-                "channels": self.handle_channels,
-                "publish": self.handle_publish,
-                "message": self.handle_message,
-                "election": self.handle_election_request,
-                "clock": self.handle_clock_request,
-                "sync": self.handle_sync_request,
-                "who_coordinator": self.handle_who_coordinator
-            }
-            
-            handler = handlers.get(service)
+            handler = self.HANDLERS.get(service)
             if handler:
-                return handler(data)
+                return handler(self, data)
             else:
                 return {
                     "service": service,
                     "data": {
                         "status": "erro",
-                        "timestamp": datetime.now().isoformat(),
+                        "timestamp": iso_now(),
                         "description": f"Serviço '{service}' não reconhecido"
                     }
                 }
         
         except Exception as e:
-            print(f"Erro ao processar requisição: {e}")
+            log(f"Erro ao processar requisição: {e}")
             return {
                 "service": "error",
                 "data": {
                     "status": "erro",
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": iso_now(),
                     "description": str(e)
                 }
             }
     
+    def count_message(self):
+        """Conta a mensagem processada (a sincronização de relógios fica em clock_sync_loop)"""
+        with self.message_count_lock:
+            self.message_count += 1
+
+    def clock_sync_loop(self):
+        """Thread única de sincronização de relógios: a cada CLOCK_SYNC_MESSAGES mensagens,
+        no máximo uma rodada por CLOCK_SYNC_INTERVAL (sob carga, sem uma thread por rodada)"""
+        while True:
+            time.sleep(CLOCK_SYNC_INTERVAL)
+            # Mensagens processadas desde a última rodada: só é zerado quando uma rodada sai
+            with self.message_count_lock:
+                if self.message_count < CLOCK_SYNC_MESSAGES:
+                    continue
+                self.message_count = 0
+
+            with self.coordinator_lock:
+                is_coordinator = self.coordinator == self.server_name
+                has_coordinator = bool(self.coordinator)
+
+            try:
+                if is_coordinator:
+                    # Se for coordenador, sincronizar todos usando Berkeley
+                    self.synchronize_clocks_berkeley()
+                elif has_coordinator:
+                    # Se não for coordenador, sincronizar com o coordenador
+                    self.request_clock_sync()
+            except Exception as e:
+                log(f"[SYNC] Erro na sincronização de relógios: {e}")
+
+    def worker(self):
+        """Thread worker: processa requisições repassadas pelo DEALER inproc"""
+        worker_socket = self.context.socket(zmq.REP)
+        worker_socket.connect("inproc://workers")
+
+        # Packer reutilizado entre respostas (um por worker: Packer não é thread-safe)
+        packer = thread_packer()
+
+        try:
+            while True:
+                # Receber requisição (MessagePack binário)
+                message = worker_socket.recv(copy=False).buffer
+
+                # Processar requisição
+                response = self.process_request(message)
+
+                # Incrementar contador de mensagens
+                self.count_message()
+
+                # Enviar resposta (MessagePack binário); bytes são imutáveis, então o envio
+                # sem cópia é seguro (abaixo de zmq.COPY_THRESHOLD o pyzmq copia mesmo assim)
+                worker_socket.send(pack_response(response, packer), copy=False)
+        except zmq.ContextTerminated:
+            pass
+        finally:
+            worker_socket.close()
+
     def server_to_server_handler(self):
         """Thread para processar requisições de outros servidores (eleição e clock)"""
         # Criar socket REP para comunicação entre servidores
         s2s_socket = self.context.socket(zmq.REP)
+        s2s_socket.setsockopt(zmq.SNDHWM, 10000)
+        s2s_socket.setsockopt(zmq.TCP_KEEPALIVE, 1)
         s2s_socket.bind("tcp://*:5561")
-        print(f"Socket servidor-servidor escutando na porta 5561")
+        log(f"Socket servidor-servidor escutando na porta 5561")
+        packer = thread_packer()
 
         while True:
             try:
                 # Receber requisição
-                message = s2s_socket.recv()
+                message = s2s_socket.recv(copy=False).buffer
 
                 # Processar
                 response = self.process_request(message)
 
-                # Enviar resposta
-                s2s_socket.send(msgpack.packb(response))
+                # Enviar resposta (sync completo pode ter vários MB: vai sem cópia)
+                s2s_socket.send(pack_response(response, packer), copy=False)
 
             except Exception as e:
-                print(f"Erro no handler servidor-servidor: {e}")
+                log(f"Erro no handler servidor-servidor: {e}")
 
     def start(self):
         """Inicia o servidor"""
         # Conectar ao broker
         broker_address = os.getenv("BROKER_ADDRESS", "tcp://broker:5556")
         self.socket.connect(broker_address)
-        print(f"Servidor conectado ao broker em {broker_address}")
+        log(f"Servidor conectado ao broker em {broker_address}")
 
         # Conectar ao proxy Pub/Sub
         proxy_address = os.getenv("PROXY_ADDRESS", "tcp://proxy:5557")
         self.pub_socket.connect(proxy_address)
-        print(f"Servidor conectado ao proxy em {proxy_address}")
+        log(f"Servidor conectado ao proxy em {proxy_address}")
 
         # Conectar ao proxy SUB para escutar tópico 'servers'
         # Nota: PROXY_ADDRESS é para PUB (5557), mas SUB precisa conectar em 5558
         proxy_sub_address = os.getenv("PROXY_SUB_ADDRESS", "tcp://proxy:5558")
         self.sub_socket.connect(proxy_sub_address)
         self.sub_socket.subscribe("servers")
-        print(f"Inscrito no tópico 'servers' em {proxy_sub_address}")
+        log(f"Inscrito no tópico 'servers' em {proxy_sub_address}")
 
         # Registrar com servidor de referência
-        print("Registrando com servidor de referência...")
-        if self.register_with_reference():
-            # Iniciar thread de heartbeat
-            heartbeat_thread = Thread(target=self.send_heartbeat, daemon=True)
-            heartbeat_thread.start()
-            print("Heartbeat iniciado")
+        log("Registrando com servidor de referência...")
+        registered = self.register_with_reference()
+        if registered:
+            self.heartbeat_socket.connect(self.reference_address)
+            log("Heartbeat iniciado")
         else:
-            print("AVISO: Falha ao registrar com servidor de referência")
+            log("AVISO: Falha ao registrar com servidor de referência")
+
+        # Iniciar laço de eventos (tópico 'servers' + heartbeat)
+        Thread(target=self.event_loop, args=(registered,), daemon=True).start()
+        log("Escutando tópico 'servers'")
 
-        # Iniciar thread para escutar tópico 'servers'
-        servers_thread = Thread(target=self.listen_to_servers_topic, daemon=True)
-        servers_thread.start()
-        print("Escutando tópico 'servers'")
+        # Iniciar thread de envio das replicações em lote
+        Thread(target=self.replication_loop, daemon=True).start()
+
+        # Iniciar thread de persistência (escritas em lote dos logs)
+        Thread(target=self.persistence_loop, daemon=True).start()
+
+        # Iniciar thread de sincronização de relógios
+        Thread(target=self.clock_sync_loop, daemon=True).start()
 
         # Iniciar thread para comunicação servidor-servidor
         s2s_thread = Thread(target=self.server_to_server_handler, daemon=True)
         s2s_thread.start()
-        print("Handler servidor-servidor iniciado")
+        log("Handler servidor-servidor iniciado")
 
         # Aguardar um pouco para outros servidores iniciarem
-        print("Aguardando outros servidores... (5s)")
+        log("Aguardando outros servidores... (5s)")
         time.sleep(5)
 
         # Sincronização inicial de dados
-        print("Solicitando sincronização completa de dados...")
+        log("Solicitando sincronização completa de dados...")
         if self.request_full_sync():
-            print("Sincronização inicial concluída com sucesso")
+            log("Sincronização inicial concluída com sucesso")
         else:
-            print("Nenhum servidor disponível para sincronização (servidor pode ser o primeiro)")
+            log("Nenhum servidor disponível para sincronização (servidor pode ser o primeiro)")
 
         # Iniciar eleição
-        print("Iniciando processo de eleição...")
+        log("Iniciando processo de eleição...")
         Thread(target=self.start_election, daemon=True).start()
 
-        print("Aguardando requisições... (MessagePack + Relógio Lógico + Berkeley + Replicação)\n")
+        log("Aguardando requisições... (MessagePack + Relógio Lógico + Berkeley + Replicação)\n")
 
-        try:
-            while True:
-                # Receber requisição (MessagePack binário)
-                message = self.socket.recv()
-
-                # Processar requisição
-                response = self.process_request(message)
+        # Pool de workers atrás do DEALER inproc
+        self.workers_socket.bind("inproc://workers")
+        for _ in range(self.num_workers):
+            Thread(target=self.worker, daemon=True).start()
+        log(f"{self.num_workers} workers processando requisições")
 
-                # Incrementar contador de mensagens
-                self.message_count += 1
-
-                # Sincronizar relógio a cada 10 mensagens
-                if self.message_count >= 10:
-                    self.message_count = 0
-
-                    # Se for coordenador, sincronizar todos usando Berkeley
-                    with self.coordinator_lock:
-                        if self.coordinator == self.server_name:
-                            Thread(target=self.synchronize_clocks_berkeley, daemon=True).start()
-                        elif self.coordinator:
-                            # Se não for coordenador, sincronizar com o coordenador
-                            Thread(target=self.request_clock_sync, daemon=True).start()
-
-                # Enviar resposta (MessagePack binário)
-                self.socket.send(msgpack.packb(response))
+        try:
+            # Repassa requisições do ROUTER para os workers e as respostas de volta
+            zmq.proxy(self.socket, self.workers_socket)
 
         except KeyboardInterrupt:
-            print("\nServidor encerrado")
+            log("\nServidor encerrado")
         finally:
+            # Gravar registros pendentes e consolidar logs nos snapshots antes de sair
+            self.flush_records()
+            for name in COLLECTIONS:
+                self.compact(name)
             self.socket.close()
+            self.workers_socket.close()
             self.pub_socket.close()
             self.sub_socket.close()
+            self.heartbeat_socket.close()
+            self.peer_pool.shutdown(wait=False)
+            self.close_peer_sockets()
             self.context.term()
+            flush_log()
 
 if __name__ == "__main__":
     server = MessageServer()
@@ -7,16 +7,24 @@ Uso: python show_coordinator.py
 
 import zmq
 import msgpack
+import time
 from datetime import datetime
 
+# Contexto único do script, compartilhado por todas as consultas
+context = zmq.Context.instance()
+
+def open_req_socket(address, timeout):
+    """Cria um socket REQ conectado; LINGER=0 para não travar ao fechar sem resposta"""
+    sock = context.socket(zmq.REQ)
+    sock.setsockopt(zmq.LINGER, 0)
+    sock.setsockopt(zmq.RCVTIMEO, timeout)
+    sock.connect(address)
+    return sock
+
 def get_servers_list():
     """Obtém lista de servidores do servidor de referência"""
+    ref_socket = open_req_socket("tcp://localhost:5559", 5000)
     try:
-        context = zmq.Context()
-        ref_socket = context.socket(zmq.REQ)
-        ref_socket.connect("tcp://localhost:5559")
-        ref_socket.setsockopt(zmq.RCVTIMEO, 5000)
-
         request = {
             "service": "list",
             "data": {
@@ -29,44 +37,57 @@ def get_servers_list():
         response = msgpack.unpackb(ref_socket.recv(), raw=False)
 
         servers = response["data"]["list"]
-        ref_socket.close()
-        context.term()
 
         return sorted(servers, key=lambda s: s["rank"])
 
     except Exception as e:
         print(f"❌ Erro ao conectar com servidor de referência: {e}")
         return []
+    finally:
+        ref_socket.close()
 
-def get_coordinator_from_server(server_name):
-    """Pergunta ao servidor quem é o coordenador"""
-    try:
-        context = zmq.Context()
-        server_socket = context.socket(zmq.REQ)
-        server_socket.connect(f"tcp://{server_name}:5561")
-        server_socket.setsockopt(zmq.RCVTIMEO, 3000)
-
-        request = {
-            "service": "who_coordinator",
-            "data": {
-                "timestamp": datetime.now().isoformat(),
-                "clock": 0
-            }
+def get_coordinators(servers, timeout=3000):
+    """Pergunta a todos os servidores, em paralelo, quem é o coordenador.
+    Retorna nome -> (coordenador, rank); quem não respondeu no prazo fica de fora."""
+    request = msgpack.packb({
+        "service": "who_coordinator",
+        "data": {
+            "timestamp": datetime.now().isoformat(),
+            "clock": 0
         }
+    })
 
-        server_socket.send(msgpack.packb(request))
-        response = msgpack.unpackb(server_socket.recv(), raw=False)
-
-        coordinator = response["data"].get("coordinator")
-        my_rank = response["data"].get("my_rank")
-
-        server_socket.close()
-        context.term()
-
-        return coordinator, my_rank
-
-    except Exception as e:
-        return None, None
+    # Um DEALER por servidor: todas as requisições saem antes de esperar qualquer resposta
+    poller = zmq.Poller()
+    sockets = {}
+    try:
+        for server in servers:
+            sock = context.socket(zmq.DEALER)
+            sock.setsockopt(zmq.LINGER, 0)
+            sock.connect(f"tcp://{server['name']}:5561")
+            sock.send_multipart([b"", request])  # Delimitador vazio esperado pelo REP
+            poller.register(sock, zmq.POLLIN)
+            sockets[sock] = server["name"]
+
+        # Prazo único para todos (não um timeout por servidor)
+        results = {}
+        deadline = time.monotonic() + timeout / 1000
+        while len(results) < len(sockets):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for sock, _ in poller.poll(remaining * 1000):
+                try:
+                    response = msgpack.unpackb(sock.recv_multipart()[-1], raw=False)
+                    results[sockets[sock]] = (response["data"].get("coordinator"), response["data"].get("my_rank"))
+                except Exception:
+                    results[sockets[sock]] = (None, None)
+                poller.unregister(sock)
+        return results
+
+    finally:
+        for sock in sockets:
+            sock.close()
 
 def main():
     print("\n" + "="*60)
@@ -84,13 +105,14 @@ def main():
     print(f"\n📋 Servidores registrados: {len(servers)}")
     print()
 
-    # Consultar cada servidor
+    # Consultar todos os servidores em paralelo
+    replies = get_coordinators(servers)
     coordinators = {}
     for server in servers:
         name = server["name"]
         rank = server["rank"]
 
-        coord, _ = get_coordinator_from_server(name)
+        coord, _ = replies.get(name, (None, None))
 
         if coord:
             coordinators[coord] = coordinators.get(coord, 0) + 1
@@ -133,3 +155,5 @@ if __name__ == "__main__":
         print("\n\n⚠️  Interrompido\n")
     except Exception as e:
         print(f"\n❌ Erro: {e}\n")
+    finally:
+        context.term()
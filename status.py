@@ -2,12 +2,31 @@
 """
 Script para monitorar o status do sistema de mensagens distribuído
 """
+import io
 import subprocess
 import sys
 import json
+import re
+import socket
+from collections import Counter
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+SERVERS = ["servidor_1", "servidor_2", "servidor_3"]
+
+# Linhas de log lidas por serviço (uma leitura atende coordenador, Berkeley e atividades)
+LOG_TAIL = 100
+
+# Linha do docker-compose logs: "servico  | mensagem"
+LOG_LINE = re.compile(r"^(\S+)\s+\| ?(.*)$", re.M)
+
+# Padrões compilados uma vez; cada um casa a linha inteira (re.M) na saída completa do log
+COORDINATOR_LINE = re.compile(r"^.*é o novo COORDENADOR.*$", re.M)
+CLOCK_SYNC_LINE = re.compile(r"^.*\[(?:BERKELEY|SYNC)\].*$", re.M)
+RELEVANT_LINE = re.compile(r"^.*(?:ELEIÇÃO|REPLICAÇÃO|BERKELEY|SYNC|Login|Canal criado).*$", re.M)
+
 def print_banner():
     """Exibe banner"""
     print("=" * 70)
@@ -15,6 +34,16 @@ def print_banner():
     print("=" * 70)
     print()
 
+# Prefixo do container_name (docker-compose.yml) -> grupo exibido
+SERVICE_TYPES = {
+    'broker': 'broker',
+    'proxy': 'proxy',
+    'referencia': 'referencia',
+    'servidor': 'servidores',
+    'bot': 'bots',
+    'cliente': 'cliente',
+}
+
 def check_containers_status():
     """Verifica status dos containers"""
     print("→ Status dos Containers:")
@@ -35,16 +64,17 @@ def check_containers_status():
 
         # Parse JSON output (cada linha é um JSON)
         containers = []
-        for line in result.stdout.strip().split('\n'):
+        for line in result.stdout.splitlines():
             if line.strip():
                 try:
                     containers.append(json.loads(line))
-                except:
+                except json.JSONDecodeError:
                     pass
 
         if not containers:
             # Fallback para formato tradicional
-            subprocess.run(["docker-compose", "ps"], check=False)
+            result = subprocess.run(["docker-compose", "ps"], capture_output=True, text=True, check=False)
+            print(result.stdout, end="")
             return True
 
         # Organizar por tipo
@@ -58,19 +88,11 @@ def check_containers_status():
         }
 
         for container in containers:
-            name = container.get('Name', '').lower()
-            if 'broker' in name:
-                services['broker'].append(container)
-            elif 'proxy' in name:
-                services['proxy'].append(container)
-            elif 'referencia' in name:
-                services['referencia'].append(container)
-            elif 'servidor' in name:
-                services['servidores'].append(container)
-            elif 'bot' in name:
-                services['bots'].append(container)
-            elif 'cliente' in name:
-                services['cliente'].append(container)
+            # container_name do docker-compose: prefixo antes do "_" identifica o tipo
+            prefix = container.get('Name', '').lower().split('_', 1)[0]
+            service_type = SERVICE_TYPES.get(prefix)
+            if service_type:
+                services[service_type].append(container)
 
         # Exibir organizadamente
         for service_type, items in services.items():
@@ -90,6 +112,125 @@ def check_containers_status():
         print(f"✗ Erro ao verificar containers: {e}")
         return False
 
+def count_frames(log_path):
+    """Conta os frames do log (tamanho em 4 bytes + MessagePack) sem decodificá-los"""
+    total_size = log_path.stat().st_size
+    count = 0
+    offset = 0
+    with open(log_path, 'rb') as f:
+        while offset + 4 <= total_size:
+            size = int.from_bytes(f.read(4), "big")
+            offset += 4 + size
+            if offset > total_size:
+                break  # Frame incompleto no fim do log
+            f.seek(offset)
+            count += 1
+    return count
+
+def read_frame_bodies(log_path):
+    """Corpos (MessagePack) dos frames completos do log"""
+    with open(log_path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + 4 <= len(data):
+        size = int.from_bytes(data[offset:offset + 4], "big")
+        if offset + 4 + size > len(data):
+            break  # Frame incompleto no fim do log
+        yield data[offset + 4:offset + 4 + size]
+        offset += 4 + size
+
+def count_log_records(file_path):
+    """Registros ainda não compactados no snapshot (frames do log append-only)"""
+    log_path = file_path.with_suffix(".mpl")
+    if log_path.exists():
+        return count_frames(log_path)
+    return 0
+
+def count_users(server_dir):
+    """Conta usuários do snapshot mais os novos registrados nos logs (cada login grava o usuário)"""
+    users = set()
+    snapshot = server_dir / "users.json"
+    if snapshot.exists():
+        with open(snapshot, 'r') as f:
+            users.update(json.load(f).get('data', {}).get('users', []))
+
+    try:
+        import msgpack  # Opcional: permite contar nomes distintos nos logs MessagePack
+    except ImportError:
+        msgpack = None
+
+    # Sem msgpack: cada frame de users.mpl/logins.mpl é um usuário novo (o servidor grava cada
+    # usuário em um só dos logs); com msgpack, os nomes entram no mesmo conjunto do snapshot
+    new_users = 0
+    for log_name in ("users.mpl", "logins.mpl"):
+        log_path = server_dir / log_name
+        if not log_path.exists():
+            continue
+        if msgpack is None:
+            new_users += count_frames(log_path)
+            continue
+        for body in read_frame_bodies(log_path):
+            record = msgpack.unpackb(body, raw=False)
+            users.add(record['user'] if isinstance(record, dict) else record)
+    return len(users) + new_users
+
+DATA_FILES = ["users.json", "channels.json", "logins.json", "messages.json", "publications.json"]
+
+def scan_server(server_dir):
+    """Conta os itens de cada arquivo de dados de um servidor (None se o diretório não existe)"""
+    if not server_dir.exists():
+        return None
+
+    counts = {}
+
+    for data_file in DATA_FILES:
+        file_path = server_dir / data_file
+        if file_path.exists():
+            try:
+                with open(file_path, 'r') as f:
+                    content = json.load(f)
+                    if isinstance(content, dict) and 'data' in content:
+                        data_content = content['data']
+                        # Contar itens
+                        if 'users' in data_content:
+                            counts[data_file] = len(data_content['users'])
+                        elif 'logins' in data_content:
+                            counts[data_file] = len(data_content['logins'])
+                        elif 'messages' in data_content:
+                            counts[data_file] = len(data_content['messages'])
+                        elif 'publications' in data_content:
+                            counts[data_file] = len(data_content['publications'])
+                        else:
+                            counts[data_file] = 0
+                    else:
+                        counts[data_file] = 0
+            except Exception as e:
+                counts[data_file] = f"Erro: {e}"
+        else:
+            counts[data_file] = 0
+
+        # Registros ainda não compactados no snapshot ficam no log append-only
+        if isinstance(counts[data_file], int):
+            try:
+                counts[data_file] += count_log_records(file_path)
+            except Exception as e:
+                counts[data_file] = f"Erro: {e}"
+
+    try:
+        counts["users.json"] = count_users(server_dir)
+    except Exception as e:
+        counts["users.json"] = f"Erro: {e}"
+
+    return counts
+
+def consistency_status(counts):
+    """Status de uma linha da tabela: todos iguais (OK ou vazio) ou inconsistente"""
+    first = counts[0]
+    # Uma única passada, sem montar conjunto; todos zero implica todos iguais
+    if all(count == first for count in counts):
+        return "- Vazio" if first == 0 else "✓ OK"
+    return "⚠ INCONSISTENTE"
+
 def check_replication_status():
     """Verifica status de replicação"""
     print("\n→ Status de Replicação:")
@@ -101,141 +242,137 @@ def check_replication_status():
         print("✗ Diretório de dados não encontrado")
         return
 
-    servers = ["servidor_1", "servidor_2", "servidor_3"]
-    data_files = ["users.json", "channels.json", "logins.json", "messages.json", "publications.json"]
+    servers = SERVERS
 
-    stats = {}
-
-    for server in servers:
-        server_dir = data_dir / server
-        if not server_dir.exists():
-            continue
-
-        stats[server] = {}
-
-        for data_file in data_files:
-            file_path = server_dir / data_file
-            if file_path.exists():
-                try:
-                    with open(file_path, 'r') as f:
-                        content = json.load(f)
-                        if isinstance(content, dict) and 'data' in content:
-                            data_content = content['data']
-                            # Contar itens
-                            if 'users' in data_content:
-                                stats[server][data_file] = len(data_content['users'])
-                            elif 'logins' in data_content:
-                                stats[server][data_file] = len(data_content['logins'])
-                            elif 'messages' in data_content:
-                                stats[server][data_file] = len(data_content['messages'])
-                            elif 'publications' in data_content:
-                                stats[server][data_file] = len(data_content['publications'])
-                            else:
-                                stats[server][data_file] = 0
-                        else:
-                            stats[server][data_file] = 0
-                except Exception as e:
-                    stats[server][data_file] = f"Erro: {e}"
-            else:
-                stats[server][data_file] = 0
+    # Um diretório por servidor, lidos em paralelo
+    server_dirs = [data_dir / server for server in servers]
+    with ThreadPoolExecutor(max_workers=len(server_dirs)) as executor:
+        scans = executor.map(scan_server, server_dirs)
+    stats = {server: counts for server, counts in zip(servers, scans) if counts is not None}
 
     # Verificar consistência
     print("\nDados por servidor:")
     print(f"{'Arquivo':<20} {'Servidor 1':>12} {'Servidor 2':>12} {'Servidor 3':>12} {'Status'}")
     print("-" * 70)
 
-    for data_file in data_files:
+    for data_file in DATA_FILES:
         counts = [stats.get(server, {}).get(data_file, 0) for server in servers]
 
-        # Verificar se todos têm o mesmo número
-        if len(set(counts)) == 1 and counts[0] != 0:
-            status = "✓ OK"
-        elif all(c == 0 for c in counts):
-            status = "- Vazio"
-        else:
-            status = "⚠ INCONSISTENTE"
+        status = consistency_status(counts)
 
         print(f"{data_file:<20} {str(counts[0]):>12} {str(counts[1]):>12} {str(counts[2]):>12} {status}")
 
-def check_coordinator():
+def fetch_logs(tail=LOG_TAIL):
+    """Últimas linhas de todos os serviços numa única chamada ao docker-compose.
+    Retorna (saída completa, serviço -> suas linhas); a exceção é guardada para quem consome."""
+    try:
+        result = subprocess.run(
+            ["docker-compose", "logs", "--tail", str(tail), "--no-color"],
+            capture_output=True,
+            text=True,
+            timeout=10
+        )
+    except Exception as e:
+        return e
+
+    # Separar por serviço pelo prefixo "servico  | " de cada linha
+    by_service = {}
+    for service, line in LOG_LINE.findall(result.stdout):
+        by_service.setdefault(service, []).append(line)
+    return result.stdout, {service: "\n".join(lines) for service, lines in by_service.items()}
+
+def service_logs(logs, service=None):
+    """Linhas de um serviço (ou a saída inteira), relançando o erro que ocorreu na busca"""
+    if isinstance(logs, Exception):
+        raise logs
+    output, by_service = logs
+    if service is None:
+        return output
+    return by_service.get(service, "")
+
+def resolves(hostname):
+    """True se o nome resolve para um endereço (ex.: nomes de serviço na rede do compose)"""
+    try:
+        socket.getaddrinfo(hostname, None)
+        return True
+    except socket.gaierror:
+        return False
+
+def query_coordinator(timeout=1000):
+    """Pergunta aos servidores (who_coordinator, em paralelo) quem é o coordenador.
+    Retorna (coordenador mais citado, respostas que o citam, servidores consultados) ou None."""
+    # Os nomes servidor_N (porta 5561 não publicada) só resolvem dentro da rede do
+    # docker-compose: fora dela, nenhuma consulta é feita e os logs são usados direto
+    if not any(resolves(server) for server in SERVERS):
+        return None
+
+    # Import tardio: zmq/msgpack só são necessários para esta consulta
+    from show_coordinator import get_servers_list, get_coordinators
+
+    servers = [server for server in get_servers_list() if resolves(server["name"])]
+    if not servers:
+        return None
+    votes = Counter(coord for coord in get_coordinators(servers, timeout).values() if coord)
+    if not votes:
+        return None
+    coordinator, count = votes.most_common(1)[0]
+    return coordinator, count, len(servers)
+
+def check_coordinator(logs):
     """Verifica quem é o coordenador atual"""
     print("\n→ Coordenador Atual:")
     print("-" * 70)
 
+    # Fonte autoritativa: os próprios servidores; os logs ficam como alternativa
+    # (ex.: porta 5561 dos servidores inacessível fora da rede do docker-compose)
     try:
-        # Verificar logs dos servidores para encontrar coordenador
-        servers = ["servidor_1", "servidor_2", "servidor_3"]
-
-        for server in servers:
-            result = subprocess.run(
-                ["docker", "logs", "--tail", "50", server],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
+        answer = query_coordinator()
+    except Exception:
+        answer = None
+    if answer:
+        coordinator, count, total = answer
+        print(f"✓ Coordenador: {coordinator} (informado por {count}/{total} servidores)")
+        return
 
+    try:
+        # Verificar logs dos servidores para encontrar coordenador
+        for server in SERVERS:
             # Procurar por anúncio de coordenador
-            for line in result.stdout.split('\n'):
-                if "é o novo COORDENADOR" in line:
-                    print(f"✓ {line.strip()}")
-                    return
+            match = COORDINATOR_LINE.search(service_logs(logs, server))
+            if match:
+                print(f"✓ {match.group().strip()}")
+                return
 
         print("⚠ Coordenador não identificado nos logs recentes")
 
     except Exception as e:
         print(f"⚠ Erro ao verificar coordenador: {e}")
 
-def check_clock_sync():
+def check_clock_sync(logs):
     """Verifica última sincronização de relógio"""
     print("\n→ Sincronização de Relógio:")
     print("-" * 70)
 
     try:
-        servers = ["servidor_1", "servidor_2", "servidor_3"]
-
-        for server in servers:
-            result = subprocess.run(
-                ["docker", "logs", "--tail", "100", server],
-                capture_output=True,
-                text=True,
-                timeout=5
-            )
-
+        for server in SERVERS:
             # Procurar por logs de Berkeley
-            berkeley_found = False
-            for line in result.stdout.split('\n'):
-                if "[BERKELEY]" in line or "[SYNC]" in line:
-                    print(f"{server}: {line.strip()}")
-                    berkeley_found = True
-                    break
-
-            if not berkeley_found:
+            match = CLOCK_SYNC_LINE.search(service_logs(logs, server))
+            if match:
+                print(f"{server}: {match.group().strip()}")
+            else:
                 print(f"{server}: Nenhuma sincronização recente")
 
     except Exception as e:
         print(f"⚠ Erro ao verificar sincronização: {e}")
 
-def show_recent_logs():
+def show_recent_logs(logs):
     """Mostra logs recentes de atividades"""
     print("\n→ Atividades Recentes:")
     print("-" * 70)
 
     try:
-        result = subprocess.run(
-            ["docker-compose", "logs", "--tail", "20", "--no-color"],
-            capture_output=True,
-            text=True,
-            timeout=10
-        )
-
-        # Filtrar linhas relevantes
-        relevant_keywords = ["ELEIÇÃO", "REPLICAÇÃO", "BERKELEY", "SYNC", "Login", "Canal criado"]
-
-        lines = result.stdout.split('\n')
-        relevant_lines = [
-            line for line in lines
-            if any(keyword in line for keyword in relevant_keywords)
-        ]
+        # Filtrar linhas relevantes (uma varredura da saída inteira)
+        relevant_lines = RELEVANT_LINE.findall(service_logs(logs))
 
         if relevant_lines:
             for line in relevant_lines[-10:]:  # Últimas 10 linhas relevantes
@@ -255,7 +392,7 @@ def show_helpful_commands():
     print("Ver logs completos de um servidor:")
     print("  docker logs -f servidor_1")
     print()
-    print("Ver apenas logs de replicação:")
+    print("Ver logs de replicação (resumo a cada 5s; por operação só com LOG_LEVEL=DEBUG):")
     print("  docker logs servidor_1 | grep REPLICAÇÃO")
     print()
     print("Ver apenas logs de eleição:")
@@ -271,35 +408,54 @@ def show_helpful_commands():
     print("  docker-compose up cliente")
     print()
 
-def main():
-    """Função principal"""
+def section(report, *args):
+    """Executa uma seção do relatório acumulando seus prints; a saída vai numa única escrita"""
+    buffer = io.StringIO()
+    try:
+        with redirect_stdout(buffer):
+            return report(*args)
+    finally:
+        sys.stdout.write(buffer.getvalue())
+        sys.stdout.flush()
+
+def print_header():
+    """Banner e horário da verificação"""
     print_banner()
-
-    # Timestamp
     print(f"Verificação realizada em: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
 
+def print_footer():
+    """Comandos úteis e encerramento"""
+    show_helpful_commands()
+    print("=" * 70)
+    print("✓ Verificação concluída")
+    print("=" * 70)
+
+def main():
+    """Função principal"""
+    # Banner e timestamp
+    section(print_header)
+
     # Status dos containers
-    if not check_containers_status():
+    if not section(check_containers_status):
         return
 
     # Status de replicação
-    check_replication_status()
+    section(check_replication_status)
+
+    # Logs de todos os serviços: uma única chamada ao docker-compose
+    logs = fetch_logs()
 
     # Coordenador
-    check_coordinator()
+    section(check_coordinator, logs)
 
     # Sincronização de relógio
-    check_clock_sync()
+    section(check_clock_sync, logs)
 
     # Logs recentes
-    show_recent_logs()
+    section(show_recent_logs, logs)
 
     # Comandos úteis
-    show_helpful_commands()
-
-    print("=" * 70)
-    print("✓ Verificação concluída")
-    print("=" * 70)
+    section(print_footer)
 
 if __name__ == "__main__":
     try:
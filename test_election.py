@@ -19,12 +19,38 @@ import msgpack
 import time
 import sys
 import subprocess
-from datetime import datetime
+
+# Intervalo entre consultas enquanto se aguarda a eleição
+ELECTION_POLL_INTERVAL = 0.1
+
+# Respostas só são lidas: arrays viram tuplas (mais baratas de alocar que listas)
+UNPACK_OPTIONS = {"raw": False, "use_list": False}
 
 class ElectionTester:
     def __init__(self):
         self.context = zmq.Context()
         self.logical_clock = 0
+        self.sockets = {}  # Endereço -> socket REQ reaproveitado entre consultas
+        self.packer = msgpack.Packer()  # Reutilizado em todas as requisições (script de uma thread)
+
+    def socket_for(self, address, timeout):
+        """Retorna o socket REQ do endereço, criando e conectando na primeira consulta"""
+        sock = self.sockets.get(address)
+        if sock is None:
+            sock = self.sockets[address] = self.context.socket(zmq.REQ)
+            sock.setsockopt(zmq.LINGER, 0)
+            # Após um timeout o REQ pode enviar de novo; respostas atrasadas são descartadas
+            sock.setsockopt(zmq.REQ_RELAXED, 1)
+            sock.setsockopt(zmq.REQ_CORRELATE, 1)
+            sock.connect(address)
+        sock.setsockopt(zmq.RCVTIMEO, timeout)
+        return sock
+
+    def close_sockets(self):
+        """Fecha os sockets reaproveitados (antes de encerrar o contexto)"""
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets.clear()
 
     def increment_clock(self):
         """Incrementa relógio lógico"""
@@ -39,26 +65,23 @@ class ElectionTester:
     def get_servers_list(self):
         """Obtém lista de servidores do servidor de referência"""
         try:
-            ref_socket = self.context.socket(zmq.REQ)
-            ref_socket.connect("tcp://localhost:5559")
-            ref_socket.setsockopt(zmq.RCVTIMEO, 5000)
+            ref_socket = self.socket_for("tcp://localhost:5559", 5000)
 
             clock = self.increment_clock()
             request = {
                 "service": "list",
                 "data": {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "clock": clock
                 }
             }
 
-            ref_socket.send(msgpack.packb(request))
-            response = msgpack.unpackb(ref_socket.recv(), raw=False)
+            ref_socket.send(self.packer.pack(request))
+            response = msgpack.unpackb(ref_socket.recv(), **UNPACK_OPTIONS)
 
             self.update_clock(response["data"]["clock"])
             servers = response["data"]["list"]
 
-            ref_socket.close()
             return servers
 
         except Exception as e:
@@ -66,34 +89,65 @@ class ElectionTester:
             print("   Certifique-se que o servidor de referência está rodando!")
             return []
 
-    def get_coordinator(self, server_name):
-        """Pergunta ao servidor quem é o coordenador atual"""
-        try:
-            # Conectar diretamente ao servidor (porta 5561 - servidor-servidor)
-            server_socket = self.context.socket(zmq.REQ)
-            server_socket.connect(f"tcp://{server_name}:5561")
-            server_socket.setsockopt(zmq.RCVTIMEO, 3000)
-
+    def get_coordinators(self, server_names, timeout=3000):
+        """Pergunta a vários servidores, em paralelo, quem é o coordenador.
+        Retorna nome -> coordenador (None para quem não respondeu no prazo)."""
+        pending = {}
+        poller = zmq.Poller()
+        for name in server_names:
+            sock = self.socket_for(f"tcp://{name}:5561", timeout)
             clock = self.increment_clock()
             request = {
                 "service": "who_coordinator",
                 "data": {
-                    "timestamp": datetime.now().isoformat(),
+                    "timestamp": time.time_ns(),
                     "clock": clock
                 }
             }
-
-            server_socket.send(msgpack.packb(request))
-            response = msgpack.unpackb(server_socket.recv(), raw=False)
-
-            coordinator = response["data"].get("coordinator")
-
-            server_socket.close()
-            return coordinator
-
-        except Exception as e:
-            print(f"   ⚠️  Servidor {server_name} não está respondendo")
-            return None
+            try:
+                sock.send(self.packer.pack(request), zmq.NOBLOCK)
+            except zmq.ZMQError:
+                continue  # Servidor fica como desconhecido (None)
+            poller.register(sock, zmq.POLLIN)
+            pending[sock] = name
+
+        # Todas as requisições já saíram: um único prazo para as respostas
+        coordinators = dict.fromkeys(server_names)
+        deadline = time.monotonic() + timeout / 1000
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            for sock, _ in poller.poll(remaining * 1000):
+                try:
+                    reply = sock.recv(zmq.NOBLOCK)
+                except zmq.Again:
+                    continue  # Resposta antiga descartada pelo REQ_CORRELATE: segue aguardando
+                except zmq.ZMQError:
+                    reply = None
+                # Falha de um servidor não interrompe o teste: ele fica como desconhecido
+                try:
+                    response = msgpack.unpackb(reply, **UNPACK_OPTIONS)
+                    self.update_clock(response["data"]["clock"])
+                    coordinators[pending[sock]] = response["data"].get("coordinator")
+                except Exception:
+                    coordinators[pending[sock]] = None
+                del pending[sock]
+                poller.unregister(sock)
+
+        return coordinators
+
+    def wait_for_coordinator(self, server_names, accept, timeout):
+        """Consulta os servidores até a maioria relatar um coordenador aceito por accept
+        (ou até o timeout, em segundos). Retorna as últimas respostas."""
+        deadline = time.monotonic() + timeout
+        while True:
+            probe_timeout = max(1, min(3000, int((deadline - time.monotonic()) * 1000)))
+            coordinators = self.get_coordinators(server_names, probe_timeout)
+            accepted = sum(1 for coord in coordinators.values() if accept(coord))
+            if accepted > len(server_names) // 2 or time.monotonic() >= deadline:
+                return coordinators
+            time.sleep(ELECTION_POLL_INTERVAL)
 
     def stop_server(self, server_name):
         """Para um servidor usando docker-compose"""
@@ -155,7 +209,7 @@ class ElectionTester:
             return
 
         # Ordenar por rank
-        servers.sort(key=lambda s: s["rank"])
+        servers = sorted(servers, key=lambda s: s["rank"])
 
         print(f"\n✅ Encontrados {len(servers)} servidores:")
         for server in servers:
@@ -165,16 +219,18 @@ class ElectionTester:
         current_coordinator = servers[-1]["name"]  # Servidor com maior rank
         print(f"\n👑 Coordenador esperado (maior rank): {current_coordinator}")
 
-        # Aguardar um pouco para a eleição inicial terminar
-        print("\n⏳ Aguardando eleição inicial (5 segundos)...")
-        time.sleep(5)
+        # Aguardar a eleição inicial terminar (a maioria já conhece um coordenador)
+        print("\n⏳ Aguardando eleição inicial (até 5 segundos)...")
+        names = [server["name"] for server in servers]
+        coordinators = self.wait_for_coordinator(names, lambda coord: coord is not None, timeout=5)
 
         # Passo 2: Confirmar quem é o coordenador antes de parar
         print("\n📋 Passo 2: Confirmando coordenador atual...")
-        for server in servers:
-            coord = self.get_coordinator(server["name"])
+        for name, coord in coordinators.items():
             if coord:
-                print(f"   • {server['name']} diz que o coordenador é: {coord}")
+                print(f"   • {name} diz que o coordenador é: {coord}")
+            else:
+                print(f"   ⚠️  Servidor {name} não está respondendo")
 
         # Passo 3: Simular falha do coordenador
         print("\n" + "="*70)
@@ -186,16 +242,19 @@ class ElectionTester:
             return
 
         # Passo 4: Aguardar eleição
-        print("\n⏳ Aguardando processo de eleição (15 segundos)...")
+        print("\n⏳ Aguardando processo de eleição (até 15 segundos)...")
         print("   Durante este tempo, o servidor com segundo maior rank deve:")
         print("   1. Detectar que o coordenador falhou")
         print("   2. Iniciar uma eleição")
         print("   3. Assumir como novo coordenador")
 
-        for i in range(15, 0, -1):
-            print(f"   ⏰ {i} segundos restantes...", end='\r')
-            time.sleep(1)
-        print("\n")
+        # Termina assim que a maioria dos servidores restantes relatar outro coordenador
+        survivors = [name for name in names if name != current_coordinator]
+        started = time.monotonic()
+        self.wait_for_coordinator(
+            survivors, lambda coord: coord is not None and coord != current_coordinator, timeout=15
+        )
+        print(f"   ⏰ Aguardado: {time.monotonic() - started:.1f} segundos\n")
 
         # Passo 5: Verificar novo coordenador
         print("="*70)
@@ -206,7 +265,7 @@ class ElectionTester:
         active_servers = self.get_servers_list()
 
         if active_servers:
-            active_servers.sort(key=lambda s: s["rank"])
+            active_servers = sorted(active_servers, key=lambda s: s["rank"])
             expected_new_coordinator = active_servers[-1]["name"]
 
             print(f"\n✅ Servidores ativos após eleição:")
@@ -217,12 +276,14 @@ class ElectionTester:
 
             # Perguntar a cada servidor quem é o coordenador
             print("\n📊 Consultando servidores sobre o coordenador atual:")
+            replies = self.get_coordinators([server["name"] for server in active_servers])
             coordinators = {}
-            for server in active_servers:
-                coord = self.get_coordinator(server["name"])
+            for name, coord in replies.items():
                 if coord:
-                    print(f"   • {server['name']} → Coordenador: {coord}")
+                    print(f"   • {name} → Coordenador: {coord}")
                     coordinators[coord] = coordinators.get(coord, 0) + 1
+                else:
+                    print(f"   ⚠️  Servidor {name} não está respondendo")
 
             # Verificar consenso
             if coordinators:
@@ -246,17 +307,18 @@ class ElectionTester:
         print("="*70)
 
         if self.start_server(current_coordinator):
-            print("\n⏳ Aguardando servidor reiniciar e se registrar (10 segundos)...")
-            time.sleep(10)
+            print("\n⏳ Aguardando servidor reiniciar e se registrar (até 10 segundos)...")
+            self.wait_for_coordinator([current_coordinator], lambda coord: coord is not None, timeout=10)
 
             # Verificar se uma nova eleição ocorreu
             print("\n🔍 Verificando se nova eleição ocorreu...")
             servers = self.get_servers_list()
-            servers.sort(key=lambda s: s["rank"])
+            servers = sorted(servers, key=lambda s: s["rank"])
 
             print(f"\n✅ Servidores ativos:")
+            replies = self.get_coordinators([server["name"] for server in servers])
             for server in servers:
-                coord = self.get_coordinator(server["name"])
+                coord = replies[server["name"]]
                 status = f"→ Coordenador: {coord}" if coord else "→ Não respondeu"
                 print(f"   • {server['name']:<20} (Rank: {server['rank']}) {status}")
 
@@ -288,6 +350,7 @@ def main():
         import traceback
         traceback.print_exc()
     finally:
+        tester.close_sockets()
         tester.context.term()
 
 if __name__ == "__main__":
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Teste: formatos de disco e de rede do servidor (frames do log, sync zstd, lotes de replicação).
+
+Executar na raiz do projeto: python -m unittest discover tests
+(requer as dependências de servidor/requirements.txt)
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Thread
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "servidor"))
+
+DEPENDENCIES = all(importlib.util.find_spec(name) for name in ("zmq", "msgpack", "orjson", "zstandard"))
+
+@unittest.skipUnless(DEPENDENCIES, "dependências do servidor não instaladas")
+class FormatsTest(unittest.TestCase):
+    def setUp(self):
+        import server
+        self.server_module = server
+        self.tmp = tempfile.TemporaryDirectory()
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            for fd in server.log_fds.values():
+                os.close(fd)
+            server.peer_pool.shutdown(wait=False)
+            server.context.destroy(linger=0)
+        self.tmp.cleanup()
+
+    def start_server(self, name):
+        server = self.server_module.MessageServer(data_dir=Path(self.tmp.name) / name)
+        server.server_name = name
+        Thread(target=server.persistence_loop, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def test_frames_round_trip_and_torn_tail(self):
+        frame_record = self.server_module.frame_record
+        records = ["geral", {"user": "ana", "timestamp": "t0"}]
+        buf = b"".join(map(frame_record, records))
+
+        # parse_frames recebe um memoryview (o log é lido via mmap, sem cópia)
+        self.assertEqual(self.server_module.parse_frames(memoryview(buf)), (records, len(buf)))
+
+        # Escrita interrompida no meio do último frame: só os frames completos são lidos
+        torn = buf + frame_record({"user": "bia", "timestamp": "t1"})[:-3]
+        self.assertEqual(self.server_module.parse_frames(memoryview(torn)), (records, len(buf)))
+
+        # Ao carregar, o servidor descarta a cauda incompleta antes dos próximos appends
+        log_path = Path(self.tmp.name) / "a" / "logins.mpl"
+        log_path.parent.mkdir()
+        log_path.write_bytes(frame_record(records[1]) + torn[len(buf):])
+
+        server = self.start_server("a")
+        self.assertEqual(server.logins, [records[1]])
+        self.assertEqual(log_path.stat().st_size, len(frame_record(records[1])))
+
+    def test_zstd_full_sync_is_decoded_and_applied(self):
+        import zmq
+
+        source = self.start_server("origem")
+        source.handle_login({"user": "ana", "timestamp": "t0", "clock": 0})
+        source.handle_channel({"channel": "geral", "clock": 0})
+        source.handle_publish({"user": "ana", "channel": "geral", "message": "oi",
+                               "timestamp": "t1", "clock": 0})
+
+        reply = source.handle_sync_request({"compression": "zstd", "clock": 0})
+        self.assertTrue(reply.startswith(self.server_module.ZSTD_MAGIC))
+
+        # Resposta servida por um REP: rpc reconhece o frame zstd e descomprime
+        rep = source.context.socket(zmq.REP)
+        rep.bind("inproc://sync")
+
+        def serve():
+            request = rep.recv()
+            rep.send(self.server_module.pack_response(
+                source.process_request(request), self.server_module.thread_packer()))
+        Thread(target=serve, daemon=True).start()
+
+        response = source.rpc("inproc://sync", {
+            "service": "sync", "data": {"compression": "zstd", "clock": 0}
+        })
+        rep.close()
+
+        target = self.start_server("destino")
+        target._apply_full_sync(response["data"])
+        target.flush_records()
+
+        self.assertEqual(target.users, ["ana"])
+        self.assertEqual(target.channels, ["geral"])
+        self.assertEqual([p["message"] for p in target.publications], ["oi"])
+
+    def test_replication_batch_is_applied_once(self):
+        import msgpack
+
+        server = self.start_server("destino")
+        batch = msgpack.packb({
+            "service": "replication_batch",
+            "data": {
+                "server": "origem",
+                "ops": [
+                    ["login", {"user": "ana", "timestamp": "t0"}, 5],
+                    ["channel", {"channel": "geral"}, 6],
+                    ["publish", {"channel": "geral", "user": "ana", "message": "oi",
+                                 "timestamp": "t1", "clock": 7}, 7],
+                ]
+            }
+        })
+
+        # O mesmo lote entregue duas vezes (ex.: reenvio pelo proxy) não duplica nada
+        for _ in range(2):
+            server.handle_servers_message(self.server_module.SERVERS_TOPIC, batch)
+        server.flush_records()
+
+        self.assertEqual(server.users, ["ana"])
+        self.assertEqual(server.channels, ["geral"])
+        self.assertEqual(len(server.publications), 1)
+        self.assertGreater(server.increment_clock(), 7)
+        self.assertEqual(server.load_collection("publications"), list(server.publications))
+
+if __name__ == "__main__":
+    unittest.main()
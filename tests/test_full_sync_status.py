@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Teste: sincronização completa seguida da contagem do status.py.
+
+Executar na raiz do projeto: python -m unittest discover tests
+(requer as dependências de servidor/requirements.txt)
+"""
+
+import importlib.util
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from threading import Thread
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "servidor"))
+
+DEPENDENCIES = all(importlib.util.find_spec(name) for name in ("zmq", "msgpack", "orjson", "zstandard"))
+
+@unittest.skipUnless(DEPENDENCIES, "dependências do servidor não instaladas")
+class FullSyncStatusTest(unittest.TestCase):
+    def setUp(self):
+        import server
+        self.server_module = server
+        self.tmp = tempfile.TemporaryDirectory()
+        self.data_dir = Path(self.tmp.name)
+        self.servers = []
+
+    def tearDown(self):
+        for server in self.servers:
+            for fd in server.log_fds.values():
+                os.close(fd)
+            server.peer_pool.shutdown(wait=False)
+            server.context.destroy(linger=0)
+        self.tmp.cleanup()
+
+    def start_server(self):
+        server = self.server_module.MessageServer(data_dir=self.data_dir)
+        Thread(target=server.persistence_loop, daemon=True).start()
+        self.servers.append(server)
+        return server
+
+    def test_synced_users_are_counted_once(self):
+        import status
+
+        server = self.start_server()
+        server.handle_login({"user": "ana", "timestamp": "t0", "clock": 0})
+        server._apply_full_sync({
+            "users": ["ana", "bia", "caio"],
+            "logins": [
+                {"user": "ana", "timestamp": "t0"},
+                {"user": "bia", "timestamp": "t1"},
+                {"user": "caio", "timestamp": "t2"},
+            ],
+            "channels": ["geral"],
+            "messages": [],
+            "publications": [],
+        })
+        server.flush_records()
+
+        # Cada usuário fica em um único log: logins.mpl (users.mpl só para usuários sem login)
+        frames = sum(
+            status.count_frames(self.data_dir / name)
+            for name in ("users.mpl", "logins.mpl")
+        )
+        self.assertEqual(frames, 3)
+
+        counts = status.scan_server(self.data_dir)
+        self.assertEqual(counts["users.json"], 3)
+        self.assertEqual(counts["logins.json"], 3)
+        self.assertEqual(counts["channels.json"], 1)
+
+        # O recarregamento do servidor vê os mesmos usuários que o status
+        reloaded = self.start_server()
+        self.assertEqual(sorted(reloaded.users), ["ana", "bia", "caio"])
+
+    def test_persistence_thread_survives_a_failed_batch(self):
+        import status
+
+        server = self.start_server()
+
+        def fail(name, items=None):
+            raise OSError("disco cheio")
+        server.compact_collection = fail
+
+        # O lote que falhou libera quem espera sem confirmar sucesso, e a thread continua atendendo
+        self.assertFalse(server.compact("channels"))
+        server.append_record("channels", "geral")
+        self.assertTrue(server.flush_records())
+        self.assertEqual(status.count_frames(self.data_dir / "channels.mpl"), 1)
+
+    def test_failed_write_is_not_acknowledged(self):
+        server = self.start_server()
+
+        # Descritor somente leitura: a escrita do log falha
+        log_fd = server.log_fds["channels"]
+        server.log_fds["channels"] = os.open(os.devnull, os.O_RDONLY)
+        server.append_record("channels", "geral")
+        self.assertFalse(server.flush_records())
+        server.append_record("channels", "geral")
+        self.assertFalse(server.replicate_operation("channel", {"channel": "geral"}, wait=True))
+        response = server.handle_channel({"channel": "outro", "sync": True, "clock": 0})
+        self.assertIsInstance(response, bytes)  # error_response já vem serializada
+        self.assertIn("Falha ao confirmar".encode(), response)
+
+        # A falha é reportada uma única vez; gravações seguintes voltam a ser confirmadas
+        os.close(server.log_fds["channels"])
+        server.log_fds["channels"] = log_fd
+        server.append_record("channels", "geral")
+        self.assertTrue(server.flush_records())
+
+    def test_failed_publish_is_not_acknowledged(self):
+        import zmq
+
+        server = self.start_server()
+        Thread(target=server.replication_loop, daemon=True).start()
+        self.assertTrue(server.replicate_operation("channel", {"channel": "geral"}, wait=True))
+
+        def fail(topic, payload):
+            raise zmq.ZMQError(zmq.ENOTSOCK)
+        server.publish = fail
+        self.assertFalse(server.replicate_operation("channel", {"channel": "outro"}, wait=True))
+
+    def test_compaction_does_not_duplicate_queued_records(self):
+        server = self.server_module.MessageServer(data_dir=self.data_dir)
+        self.servers.append(server)
+
+        # Login já em memória, mas com o frame ainda na fila quando o log é compactado
+        login = {"user": "ana", "timestamp": "t0"}
+        server.logins.append(login)
+        server.append_record("logins", login)
+        server.compact_collection("logins")
+
+        batch = []
+        while not server.write_queue.empty():
+            batch.append(server.write_queue.get_nowait())
+        server.write_batch(batch)
+
+        self.assertEqual(server.load_collection("logins"), [login])
+
+if __name__ == "__main__":
+    unittest.main()